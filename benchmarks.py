@@ -0,0 +1,797 @@
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import random
+import resource
+import sqlite3
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import ccxt
+import aiohttp
+import numpy as np
+import telegram.error
+from aiohttp import web
+
+try:
+    import talib
+except ImportError:  # only needed to cross-check the local indicator engine
+    talib = None
+
+os.environ.setdefault('ADMIN_USER_ID', '0')
+os.environ.setdefault('TOKEN', '123456:bench')
+os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+import telegram_bot
+
+
+def print_results(title, rows):
+    print(f"\n{title}")
+    for name, ops, elapsed in rows:
+        rate = ops / elapsed if elapsed else float('inf')
+        print(f"  {name:<40} {ops:>8} ops  {elapsed:8.3f}s  {rate:12.0f} ops/s")
+
+
+# --- Database ---
+def legacy_get_user_language(path, user_id):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute('SELECT language FROM users WHERE user_id = ?', (user_id,))
+    result = cursor.fetchone()
+    conn.close()
+    return result[0] if result and result[0] else None
+
+
+def legacy_save_sent_signal(path, symbol, timeframe, signal):
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute('INSERT OR REPLACE INTO sent_signals (symbol, timeframe, signal, timestamp) VALUES (?, ?, ?, ?)', (symbol, timeframe, signal, time.time()))
+    conn.commit()
+    conn.close()
+
+
+def bench_database(iterations, users=1000):
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, 'legacy.db')
+        pooled_path = os.path.join(tmp, 'pooled.db')
+        rows = []
+
+        for path in (legacy_path, pooled_path):
+            conn = sqlite3.connect(path)
+            telegram_bot.create_schema(conn)
+            conn.executemany('INSERT INTO users (user_id, language) VALUES (?, ?)', [(i, 'en') for i in range(users)])
+            conn.commit()
+            conn.close()
+
+        started = time.perf_counter()
+        for i in range(iterations):
+            legacy_get_user_language(legacy_path, i % users)
+        rows.append(('per-call connect: read', iterations, time.perf_counter() - started))
+
+        started = time.perf_counter()
+        for i in range(iterations):
+            legacy_save_sent_signal(legacy_path, f"SYM{i % 100}", '1h', 'BUY')
+        rows.append(('per-call connect: write', iterations, time.perf_counter() - started))
+
+        db = telegram_bot.Database(pooled_path)
+
+        async def run_pooled():
+            started = time.perf_counter()
+            for i in range(iterations):
+                await db.fetchone('SELECT language FROM users WHERE user_id = ?', (i % users,))
+            rows.append(('Database: read', iterations, time.perf_counter() - started))
+
+            started = time.perf_counter()
+            for i in range(iterations):
+                await db.execute('INSERT OR REPLACE INTO sent_signals (symbol, timeframe, signal, timestamp) VALUES (?, ?, ?, ?)', (f"SYM{i % 100}", '1h', 'BUY', time.time()))
+            rows.append(('Database: write', iterations, time.perf_counter() - started))
+
+            started = time.perf_counter()
+            await db.executemany('INSERT OR REPLACE INTO sent_signals (symbol, timeframe, signal, timestamp) VALUES (?, ?, ?, ?)', [(f"SYM{i % 100}", '1h', 'BUY', time.time()) for i in range(iterations)])
+            rows.append(('Database: batched write', iterations, time.perf_counter() - started))
+
+            await db.close()
+
+        asyncio.run(run_pooled())
+        print_results(f"SQLite access ({users} users)", rows)
+
+
+# --- Indicators ---
+def synthetic_candles(symbols, length, seed=7):
+    rng = np.random.default_rng(seed)
+    candles = {}
+    for i in range(symbols):
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, length)))
+        spread = np.abs(rng.normal(0, 0.005, length)) * close
+        candles[f"SYM{i}USDT"] = {'high': close + spread, 'low': close - spread, 'close': close}
+    return candles
+
+
+def bench_indicators(symbol_counts, length=None):
+    length = length or telegram_bot.CANDLE_HISTORY_DEPTH
+    rows = []
+    for count in symbol_counts:
+        candles = synthetic_candles(count, length)
+        started = time.perf_counter()
+        recommendations = telegram_bot.compute_local_recommendations(candles)
+        elapsed = time.perf_counter() - started
+        assert len(recommendations) == count
+        rows.append((f"local engine scan, {count} symbols", count, elapsed))
+    print_results(f"Local indicator engine ({length} bars per symbol)", rows)
+    compare_with_talib(synthetic_candles(1, length), length)
+
+
+def compare_with_talib(candles, length):
+    if talib is None:
+        print("\nTA-Lib is not installed; skipping the indicator cross-check")
+        return
+    arrays = next(iter(candles.values()))
+    high, low, close = (telegram_bot.stack_series([arrays[field]], length) for field in ('high', 'low', 'close'))
+    k, d = telegram_bot.stochastic(high, low, close)
+    macd_line = telegram_bot.ema(close, 12) - telegram_bot.ema(close, 26)
+    talib_k, talib_d = talib.STOCH(arrays['high'], arrays['low'], arrays['close'], 14, 3, 0, 3, 0)
+    talib_macd, talib_signal, _ = talib.MACD(arrays['close'])
+    pairs = [(f"EMA{period}", telegram_bot.ema(close, period), talib.EMA(arrays['close'], period)) for period in telegram_bot.MA_PERIODS]
+    pairs += [
+        ("RSI14", telegram_bot.rsi(close), talib.RSI(arrays['close'], 14)),
+        ("MACD", macd_line, talib_macd),
+        ("MACD signal", telegram_bot.ema(macd_line, 9), talib_signal),
+        ("Stoch %K", k, talib_k),
+        ("Stoch %D", d, talib_d),
+        ("ATR14", telegram_bot.average_true_range(arrays['high'], arrays['low'], arrays['close']), talib.ATR(arrays['high'], arrays['low'], arrays['close'], 14)),
+    ]
+    print(f"\nLast value vs TA-Lib ({length} bars)")
+    for name, local, reference in pairs:
+        local, reference = float(np.ravel(local)[-1]), float(reference[-1])
+        print(f"  {name:<12} local {local:12.4f}  TA-Lib {reference:12.4f}  rel. error {abs(local - reference) / abs(reference):.2e}")
+
+
+def bench_processes(symbol_counts, process_counts, length=None):
+    # Local process pool scaling for the indicator math; the first call per pool size pays the spawn cost.
+    length = length or telegram_bot.CANDLE_HISTORY_DEPTH
+
+    async def run():
+        rows = []
+        for count in symbol_counts:
+            candles = synthetic_candles(count, length)
+            for processes in process_counts:
+                telegram_bot.EXECUTORS.shutdown()
+                telegram_bot.EXECUTORS.workers['process'] = processes
+                await telegram_bot.compute_recommendations(dict(list(candles.items())[:processes * 2]), processes)
+                started = time.perf_counter()
+                recommendations = await telegram_bot.compute_recommendations(candles, processes)
+                elapsed = time.perf_counter() - started
+                assert len(recommendations) == count
+                rows.append((f"{count} symbols, {processes} process{'es' if processes != 1 else ''}", count, elapsed))
+        telegram_bot.EXECUTORS.shutdown()
+        print_results(f"Indicator engine across processes ({length} bars per symbol, {os.cpu_count()} CPUs)", rows)
+
+    asyncio.run(run())
+
+
+# --- Resampling ---
+def synthetic_base_series(length, timeframe, seed=11):
+    rng = np.random.default_rng(seed)
+    step = telegram_bot.TIMEFRAME_MS[timeframe]
+    start = (1_700_000_000_000 // telegram_bot.TIMEFRAME_MS['1d']) * telegram_bot.TIMEFRAME_MS['1d']
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, length)))
+    open_ = np.r_[close[0], close[:-1]]
+    spread = np.abs(rng.normal(0, 0.005, length)) * close
+    return {
+        'timestamp': (start + np.arange(length) * step).astype(np.float64),
+        'open': open_,
+        'high': np.maximum(open_, close) + spread,
+        'low': np.minimum(open_, close) - spread,
+        'close': close,
+        'volume': rng.random(length) * 1000,
+    }
+
+
+def bench_resample(symbol_counts, verify_symbols):
+    base = synthetic_base_series(telegram_bot.BASE_HISTORY_DEPTH, telegram_bot.RESAMPLE_BASE_TIMEFRAME)
+    rows = []
+    for count in symbol_counts:
+        started = time.perf_counter()
+        for _ in range(count):
+            for timeframe in telegram_bot.RESAMPLE_TIMEFRAMES:
+                telegram_bot.resample_ohlcv(base, timeframe)
+        rows.append((f"resample {len(telegram_bot.RESAMPLE_TIMEFRAMES)} timeframes, {count} symbols", count, time.perf_counter() - started))
+    print_results(f"Resampling from {telegram_bot.RESAMPLE_BASE_TIMEFRAME} ({len(base['timestamp'])} base bars)", rows)
+
+    if not verify_symbols:
+        return
+
+    async def verify():
+        store = telegram_bot.CandleStore()
+        print("\nBar-for-bar check against exchange candles")
+        try:
+            for symbol in verify_symbols:
+                for timeframe in sorted(telegram_bot.RESAMPLE_TIMEFRAMES):
+                    result = await telegram_bot.verify_resampled_candles(symbol, timeframe, store=store)
+                    print(f"  {symbol:<12} {timeframe:<4} {result['compared']:>4} bars compared, {len(result['mismatches'])} mismatches")
+                    for mismatch in result['mismatches'][:3]:
+                        print(f"    {mismatch}")
+        finally:
+            await telegram_bot.close_exchange()
+
+    asyncio.run(verify())
+
+
+# --- Executors ---
+async def measure_loop_lag(work, interval=0.01):
+    # Largest delay between scheduled ticks of a heartbeat task while `work` runs.
+    worst = 0.0
+    done = asyncio.Event()
+
+    async def heartbeat():
+        nonlocal worst
+        while not done.is_set():
+            expected = time.perf_counter() + interval
+            await asyncio.sleep(interval)
+            worst = max(worst, time.perf_counter() - expected)
+
+    ticker = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0)
+    started = time.perf_counter()
+    await work()
+    elapsed = time.perf_counter() - started
+    done.set()
+    await ticker
+    return elapsed, worst
+
+
+def bench_executors(commands, blocking_seconds=0.05):
+    def blocking_call():
+        time.sleep(blocking_seconds)
+
+    async def inline():
+        for _ in range(commands):
+            blocking_call()
+
+    async def offloaded():
+        await asyncio.gather(*(telegram_bot.EXECUTORS.run('network', blocking_call) for _ in range(commands)))
+
+    async def run():
+        rows = []
+        for name, work in (('blocking call on the event loop', inline), ('network executor pool', offloaded)):
+            elapsed, lag = await measure_loop_lag(work)
+            rows.append((name, commands, elapsed))
+            print(f"  {name:<40} worst event loop stall {lag * 1000:8.1f} ms")
+        print_results(f"{commands} concurrent commands, {blocking_seconds * 1000:.0f} ms of blocking I/O each", rows)
+        print(f"  executor stats: {telegram_bot.EXECUTORS.stats()['network']}")
+        telegram_bot.EXECUTORS.shutdown()
+
+    asyncio.run(run())
+
+
+# --- Load Test Stand-ins ---
+class FaultInjector:
+    # Deterministic latency and error injection shared by the fake upstreams.
+    def __init__(self, latency=0.0, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+
+    def should_fail(self):
+        self.calls += 1
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.errors += 1
+            return True
+        return False
+
+    async def wait(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+
+class FakeBot:
+    # Stands in for telegram.Bot: records deliveries, optionally slow and flaky.
+    def __init__(self, faults):
+        self.faults = faults
+        self.sent = 0
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self.faults.wait()
+        if self.faults.should_fail():
+            raise telegram.error.NetworkError("injected failure")
+        self.sent += 1
+
+
+class FakeExchange:
+    # Stands in for the ccxt async client with synthetic, per-symbol deterministic market data.
+    def __init__(self, faults, seed=0):
+        self.faults = faults
+        self.seed = seed
+        self.symbols = []
+
+    async def _call(self, symbol=None):
+        await self.faults.wait()
+        if self.faults.should_fail():
+            raise ccxt.NetworkError("injected failure")
+        # Like Binance, reject symbols it does not list (an empty universe accepts everything).
+        if symbol is not None and self.symbols and symbol not in self._listed:
+            raise ccxt.BadSymbol(f"binance does not have market symbol {symbol}")
+
+    @property
+    def symbols(self):
+        return self._symbols
+
+    @symbols.setter
+    def symbols(self, symbols):
+        self._symbols = list(symbols)
+        self._listed = set(self._symbols)
+
+    def _ticker(self, symbol):
+        price = 1 + random.Random(f"{self.seed}:{symbol}").random() * 1000
+        return {'symbol': symbol, 'last': price, 'percentage': 1.5, 'high': price * 1.02, 'low': price * 0.98, 'quoteVolume': 1e6}
+
+    async def fetch_ticker(self, symbol):
+        await self._call(symbol)
+        return self._ticker(symbol)
+
+    async def fetch_tickers(self, symbols=None):
+        await self._call()
+        return {symbol: self._ticker(symbol) for symbol in symbols or self.symbols if not self.symbols or symbol in self._listed}
+
+    async def fetch_ohlcv(self, symbol, timeframe, since=None, limit=None):
+        await self._call(symbol)
+        step = telegram_bot.TIMEFRAME_MS[timeframe]
+        limit = limit or 500
+        now = int(time.time() * 1000) // step * step
+        start = since if since is not None else now - (limit - 1) * step
+        timestamps = np.arange(start, min(now, start + (limit - 1) * step) + 1, step)
+        rng = np.random.default_rng(abs(hash((self.seed, symbol, timeframe))) % 2 ** 32)
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(timestamps))))
+        spread = np.abs(rng.normal(0, 0.005, len(timestamps))) * close
+        return [[int(ts), c, c + d, c - d, c, 1000.0] for ts, c, d in zip(timestamps, close, spread)]
+
+    async def load_markets(self, reload=False):
+        return fake_markets(self.symbols)
+
+    async def close(self):
+        pass
+
+
+def fake_markets(symbols):
+    # ccxt-shaped market entries keyed by unified symbol; ids are kept as-is so tickers stay keyed by id.
+    return {symbol: {'id': symbol, 'symbol': symbol, 'quote': 'USDT', 'spot': True, 'active': True} for symbol in symbols}
+
+
+UNKNOWN_SYMBOL = 'UNKNOWNUSDT'
+
+
+class FakeTradingView:
+    # Replaces get_tradingview_analyses; recommendations depend only on (seed, round, symbol, timeframe).
+    RECOMMENDATIONS = ('STRONG_BUY', 'BUY', 'NEUTRAL', 'SELL', 'STRONG_SELL')
+
+    def __init__(self, faults, seed=0):
+        self.faults = faults
+        self.seed = seed
+        self.round = 0
+
+    def get_tradingview_analyses(self, timeframe_str, symbols):
+        if self.faults.latency:
+            time.sleep(self.faults.latency)
+        if self.faults.should_fail():
+            raise ConnectionError("injected failure")
+        # Like TradingView, symbols it does not list come back without an analysis.
+        return {
+            f"BINANCE:{symbol}": None if symbol.startswith(UNKNOWN_SYMBOL) else SimpleNamespace(summary={'RECOMMENDATION': random.Random(f"{self.seed}:{self.round}:{symbol}:{timeframe_str}").choice(self.RECOMMENDATIONS)})
+            for symbol in symbols
+        }
+
+
+class FakeMessage:
+    def __init__(self, bot):
+        self.bot = bot
+
+    async def reply_text(self, text, **kwargs):
+        await self.bot.send_message(None, text, **kwargs)
+
+
+def fake_update(user_id, bot):
+    message = FakeMessage(bot)
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), message=message, effective_message=message, callback_query=None)
+
+
+def write_news_fixture(path, stories, seed=0):
+    items = ''.join(f"<item><title>Story {seed}-{i}</title><link>https://news.example/{seed}/{i}</link></item>" for i in range(stories))
+    with open(path, 'w') as f:
+        f.write(f'<?xml version="1.0"?><rss version="2.0"><channel><title>fixture</title>{items}</channel></rss>')
+
+
+# --- Load Tests ---
+class LoadTest:
+    # Swaps the bot's module-level singletons for fresh instances backed by a temporary database and the
+    # stand-ins above, so a run never touches live services or crypto_bot.db.
+    TIMEFRAMES = ('15m', '1h', '4h')
+
+    def __init__(self, tmp, args):
+        self.args = args
+        faults = lambda offset: FaultInjector(args.latency / 1000, args.error_rate, args.seed + offset)
+        self.bot = FakeBot(faults(1))
+        self.exchange = FakeExchange(faults(2), args.seed)
+        self.tradingview = FakeTradingView(faults(3), args.seed)
+        self.news_path = os.path.join(tmp, 'news.xml')
+
+        tb = telegram_bot
+        tb.SIGNAL_ENGINE = args.engine
+        tb.BROADCAST_RATE_LIMIT = args.send_rate or 1e9
+        if not args.send_rate:
+            tb.PRIVATE_CHAT_INTERVAL = tb.GROUP_CHAT_INTERVAL = 0.0
+        tb.RATE_LIMITERS = {name: tb.TokenBucket(1e9) for name in tb.RATE_LIMITERS}
+        tb.get_tradingview_analyses = self.tradingview.get_tradingview_analyses
+        tb.DB = tb.Database(os.path.join(tmp, 'load.db'))
+        tb.SUBSCRIPTIONS = tb.SubscriptionIndex()
+        tb.USER_CACHE = tb.UserProfileCache()
+        tb.TICKER_CACHE = tb.TickerCache()
+        tb.CANDLE_STORE = tb.CandleStore()
+        tb.ANALYSIS_CACHE = tb.AnalysisCache()
+        tb.NEWS_PIPELINE = tb.NewsPipeline([self.news_path])
+        tb.BROADCASTER = tb.BroadcastQueue()
+        tb.SYMBOL_UNIVERSE = tb.SymbolUniverse()
+        tb.set_exchange(self.exchange)
+
+    def populate(self, users, symbols):
+        rng = random.Random(self.args.seed)
+        universe = [f"SYM{i}USDT" for i in range(symbols)]
+        self.exchange.symbols = universe
+        telegram_bot.SYMBOL_UNIVERSE.load(fake_markets(universe))
+        expiry = (datetime.datetime.now() + datetime.timedelta(days=30)).isoformat()
+        user_rows = []
+        subscription_rows = []
+        for user_id in range(1, users + 1):
+            chosen_symbols = rng.sample(universe, min(3, symbols))
+            chosen_timeframes = rng.sample(self.TIMEFRAMES, rng.randint(1, 2))
+            user_rows.append((user_id, 1, expiry, rng.choice(('ar', 'en')), ','.join(chosen_symbols), ','.join(chosen_timeframes)))
+            subscription_rows.extend((user_id, symbol, timeframe) for symbol in chosen_symbols for timeframe in chosen_timeframes)
+
+        def insert(conn):
+            conn.executemany('INSERT INTO users (user_id, is_subscribed, subscription_expiry_date, language, subscribed_symbols, subscribed_timeframes) VALUES (?, ?, ?, ?, ?, ?)', user_rows)
+            conn.executemany('INSERT INTO user_subscriptions (user_id, symbol, timeframe) VALUES (?, ?, ?)', subscription_rows)
+
+        telegram_bot.setup_database()
+        telegram_bot.DB.call(insert)
+        telegram_bot.setup_database()
+        return universe
+
+    async def measure(self, work):
+        # Runs `work`, waits until every queued message is delivered, and returns the counters of interest.
+        db_ops = db_query_count()
+        sent = self.bot.sent
+        if self.args.memory:
+            tracemalloc.start()
+        started = time.perf_counter()
+        result = await work()
+        work_time = time.perf_counter() - started
+        await telegram_bot.BROADCASTER.join()
+        total_time = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if self.args.memory else None
+        if self.args.memory:
+            tracemalloc.stop()
+        return {
+            'result': result,
+            'work_time': work_time,
+            'total_time': total_time,
+            'messages': self.bot.sent - sent,
+            'db_ops': db_query_count() - db_ops,
+            'peak_memory': peak,
+        }
+
+    async def close(self):
+        await telegram_bot.BROADCASTER.stop()
+        await telegram_bot.DB.close()
+
+
+def db_query_count():
+    _, histograms = telegram_bot.METRICS.snapshot()
+    return sum(count for (name, _), (count, _, _) in histograms.items() if name == 'db_query_seconds')
+
+
+def format_memory(measurement):
+    if measurement['peak_memory'] is not None:
+        return f"peak {measurement['peak_memory'] / 2 ** 20:7.1f} MiB traced"
+    return f"max RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:7.1f} MiB"
+
+
+def print_load_row(name, measurement):
+    rate = measurement['messages'] / measurement['total_time'] if measurement['total_time'] else 0.0
+    print(f"  {name:<28} work {measurement['work_time']:7.3f}s  drained {measurement['total_time']:7.3f}s  "
+          f"{measurement['messages']:>7} msgs  {rate:9.0f} msg/s  {measurement['db_ops']:>6} db ops  {format_memory(measurement)}")
+
+
+def run_load_test(args, scenario):
+    async def run():
+        for users in args.users:
+            for symbols in args.symbols:
+                with tempfile.TemporaryDirectory() as tmp:
+                    load = LoadTest(tmp, args)
+                    load.populate(users, symbols)
+                    telegram_bot.BROADCASTER.start(load.bot)
+                    try:
+                        print(f"\n{scenario.__name__[5:]}: {users} users, {symbols} symbols, engine={args.engine}, "
+                              f"latency={args.latency}ms, error rate={args.error_rate}, send rate={args.send_rate or 'unlimited'}")
+                        await scenario(load, args, symbols)
+                    finally:
+                        await load.close()
+        await telegram_bot.close_exchange()
+        telegram_bot.EXECUTORS.shutdown()
+
+    asyncio.run(run())
+
+
+async def load_scan(load, args, symbols):
+    context = SimpleNamespace(bot=load.bot, job=None)
+    for round_number in range(args.rounds):
+        load.tradingview.round = round_number
+
+        async def scan():
+            started = time.perf_counter()
+            await telegram_bot.monitor_tradingview_signals(context)
+            return time.perf_counter() - started
+
+        print_load_row(f"scan round {round_number + 1}", await load.measure(scan))
+
+
+async def load_news(load, args, symbols):
+    context = SimpleNamespace(bot=load.bot, job=None)
+    for round_number in range(args.rounds):
+        write_news_fixture(load.news_path, args.stories, seed=round_number)
+        print_load_row(f"news poll {round_number + 1} ({args.stories} stories)", await load.measure(lambda: telegram_bot.monitor_news(context)))
+
+
+async def load_handlers(load, args, symbols):
+    rng = random.Random(args.seed)
+    universe = [f"SYM{i}USDT" for i in range(symbols)]
+    users = max(args.users)
+    handlers = (
+        (telegram_bot.analyze_command, lambda: [rng.choice(universe + [UNKNOWN_SYMBOL]), rng.choice(LoadTest.TIMEFRAMES)]),
+        (telegram_bot.info_command, lambda: [rng.choice(universe)]),
+        (telegram_bot.status_command, lambda: []),
+        (telegram_bot.menu_command, lambda: []),
+    )
+    for handler, make_args in handlers:
+        latencies = []
+
+        async def invoke(user_id, arguments):
+            started = time.perf_counter()
+            await handler(fake_update(user_id, load.bot), SimpleNamespace(args=arguments, bot=load.bot))
+            latencies.append(time.perf_counter() - started)
+
+        calls = [(rng.randint(1, users), make_args()) for _ in range(args.commands)]
+        measurement = await load.measure(lambda: asyncio.gather(*(invoke(user_id, arguments) for user_id, arguments in calls)))
+        latencies.sort()
+        print_load_row(f"{args.commands} x {handler.__name__}", measurement)
+        print(f"  {'':<28} latency p50 {latencies[len(latencies) // 2] * 1000:7.1f} ms  p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.1f} ms")
+    assert not any(key[0] == UNKNOWN_SYMBOL for key in telegram_bot.ANALYSIS_CACHE._results), "missing analysis was cached"
+
+
+# --- Serving Modes ---
+class FakeBotApi:
+    # Minimal local Telegram Bot API: long-polled getUpdates, webhook registration and sendMessage,
+    # recording when the reply for each chat arrives.
+    def __init__(self):
+        self.updates = []
+        self.update_added = asyncio.Event()
+        self.replies = {}
+        self._runner = None
+        self._message_ids = 0
+
+    async def params(self, request):
+        data = dict(await request.post()) if request.content_type != 'application/json' else await request.json()
+        params = {}
+        for key, value in data.items():
+            try:
+                params[key] = json.loads(value) if isinstance(value, str) else value
+            except ValueError:
+                params[key] = value
+        return params
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = await self.params(request)
+        if method == 'getMe':
+            return self.ok({'id': 1, 'is_bot': True, 'first_name': 'bench', 'username': 'bench_bot'})
+        if method == 'getUpdates':
+            return self.ok(await self.get_updates(params.get('offset') or 0, params.get('timeout') or 0))
+        if method == 'sendMessage':
+            chat_id = params['chat_id']
+            future = self.replies.get(chat_id)
+            if future is not None and not future.done():
+                future.set_result(time.perf_counter())
+            self._message_ids += 1
+            return self.ok({'message_id': self._message_ids, 'date': int(time.time()), 'chat': {'id': chat_id, 'type': 'private'}, 'text': params.get('text', '')})
+        return self.ok(True)
+
+    def ok(self, result):
+        return web.json_response({'ok': True, 'result': result})
+
+    async def get_updates(self, offset, timeout):
+        self.updates = [update for update in self.updates if update['update_id'] >= offset]
+        if not self.updates and timeout:
+            self.update_added.clear()
+            try:
+                await asyncio.wait_for(self.update_added.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(self.updates)
+
+    def push(self, update):
+        self.updates.append(update)
+        self.update_added.set()
+
+    async def start(self, port):
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '127.0.0.1', port).start()
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+def command_update(update_id, user_id, text='/myid'):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"},
+            'text': text,
+            'entities': [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}],
+        },
+    }
+
+
+def bench_serving(updates, api_port=18081, webhook_port=18082):
+    async def measure(api, deliver):
+        latencies = []
+        for update_id in range(1, updates + 1):
+            user_id = 1000 + update_id
+            api.replies[user_id] = asyncio.get_running_loop().create_future()
+            started = time.perf_counter()
+            await deliver(command_update(update_id, user_id))
+            latencies.append(await asyncio.wait_for(api.replies[user_id], 10) - started)
+        latencies.sort()
+        return latencies
+
+    async def run():
+        api = FakeBotApi()
+        await api.start(api_port)
+        base_url = f"http://127.0.0.1:{api_port}/bot"
+        rows = []
+        with tempfile.TemporaryDirectory() as tmp:
+            telegram_bot.DB = telegram_bot.Database(os.path.join(tmp, 'serving.db'))
+            telegram_bot.setup_database()
+            telegram_bot.set_exchange(FakeExchange(FaultInjector()))
+
+            app = telegram_bot.build_application('polling', base_url=base_url)
+            await app.initialize()
+            await telegram_bot.on_startup(app)
+            await app.start()
+            await app.updater.start_polling(poll_interval=0.0, timeout=10)
+
+            async def push(update):
+                api.push(update)
+
+            rows.append(('long polling', await measure(api, push)))
+            await app.updater.stop()
+            await app.stop()
+            await app.shutdown()
+            await telegram_bot.BROADCASTER.stop()
+
+            app = telegram_bot.build_application('webhook', base_url=base_url)
+            await app.initialize()
+            telegram_bot.BROADCASTER.start(app.bot)
+            await app.start()
+            server = telegram_bot.WebhookServer(app, port=webhook_port, secret='bench-secret')
+            await server.start()
+            async with aiohttp.ClientSession() as session:
+                url = f"http://127.0.0.1:{webhook_port}{server.path}"
+
+                async def post(update):
+                    async with session.post(url, json=update, headers={'X-Telegram-Bot-Api-Secret-Token': 'bench-secret'}) as response:
+                        assert response.status == 200
+
+                rows.append(('webhook', await measure(api, post)))
+                async with session.post(url, json=command_update(0, 1)) as response:
+                    print(f"\n  request without secret token -> HTTP {response.status}")
+                async with session.get(f"http://127.0.0.1:{webhook_port}/healthz") as response:
+                    print(f"  /healthz -> HTTP {response.status} {await response.text()}")
+            await server.stop()
+            await app.stop()
+            await telegram_bot.on_shutdown(app)
+            await app.shutdown()
+        await api.stop()
+
+        print(f"\nUpdate-to-reply latency, {updates} sequential /myid commands against a local Bot API")
+        for name, latencies in rows:
+            print(f"  {name:<16} p50 {latencies[len(latencies) // 2] * 1000:7.2f} ms  p95 {latencies[int(len(latencies) * 0.95)] * 1000:7.2f} ms  max {latencies[-1] * 1000:7.2f} ms")
+
+    asyncio.run(run())
+
+
+# --- Symbol Universe ---
+def bench_symbols(symbol_counts, iterations):
+    rng = random.Random(0)
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    translations = telegram_bot.get_messages('en')
+    rows = []
+    for count in symbol_counts:
+        names = {''.join(rng.choice(letters) for _ in range(rng.randint(2, 6))) + 'USDT' for _ in range(count)}
+        universe = telegram_bot.SymbolUniverse()
+        started = time.perf_counter()
+        universe.load(fake_markets(names))
+        rows.append((f"index {len(universe)} symbols", 1, time.perf_counter() - started))
+
+        prefixes = [''.join(rng.choice(letters) for _ in range(rng.randint(1, 3))) for _ in range(iterations)]
+        started = time.perf_counter()
+        for prefix in prefixes:
+            universe.search(prefix, telegram_bot.SYMBOL_SEARCH_LIMIT)
+        rows.append((f"prefix search, {len(universe)} symbols", iterations, time.perf_counter() - started))
+
+        telegram_bot.SYMBOL_UNIVERSE = universe
+        subscribed = rng.sample(sorted(names), min(20, len(names)))
+        pages = universe.page(0)[2]
+        started = time.perf_counter()
+        for i in range(iterations):
+            markup = telegram_bot.settings_keyboard(i % pages, subscribed, ['1h'], translations)
+        rows.append((f"settings page, {pages} pages", iterations, time.perf_counter() - started))
+        longest = max(len(button.callback_data.encode()) for row in markup.inline_keyboard for button in row)
+        assert longest <= 64, f"callback data of {longest} bytes exceeds Telegram's limit"
+    telegram_bot.SYMBOL_UNIVERSE = telegram_bot.SymbolUniverse()
+    print_results("Symbol universe", rows)
+
+
+BENCHMARKS = {
+    'database': lambda args: bench_database(args.iterations),
+    'executors': lambda args: bench_executors(args.commands),
+    'handlers': lambda args: run_load_test(args, load_handlers),
+    'indicators': lambda args: bench_indicators(args.symbols),
+    'news': lambda args: run_load_test(args, load_news),
+    'processes': lambda args: bench_processes(args.symbols, args.processes),
+    'resample': lambda args: bench_resample(args.symbols, args.verify),
+    'scan': lambda args: run_load_test(args, load_scan),
+    'serving': lambda args: bench_serving(args.updates),
+    'symbols': lambda args: bench_symbols(args.symbols, args.iterations),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the crypto bot.")
+    parser.add_argument('benchmarks', nargs='*', help=f"benchmarks to run: {', '.join(sorted(BENCHMARKS))} (default: all)")
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--commands', type=int, default=40, help="concurrent commands for the executor benchmark")
+    parser.add_argument('--symbols', type=lambda value: [int(item) for item in value.split(',')], default=[5, 50, 500], help="comma-separated symbol counts")
+    parser.add_argument('--processes', type=lambda value: [int(item) for item in value.split(',')], default=[1, 2, 4], help="comma-separated process pool sizes")
+    parser.add_argument('--users', type=lambda value: [int(item) for item in value.split(',')], default=[1000, 10000], help="comma-separated user counts for load tests")
+    parser.add_argument('--engine', choices=('tradingview', 'local'), default='tradingview', help="signal engine used by load tests")
+    parser.add_argument('--latency', type=float, default=0.0, help="injected latency per fake upstream call, in ms")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of fake upstream calls that fail")
+    parser.add_argument('--send-rate', type=float, default=0.0, help="broadcast rate limit in msg/s for load tests (0: unlimited)")
+    parser.add_argument('--rounds', type=int, default=2, help="scan or news rounds per population")
+    parser.add_argument('--stories', type=int, default=5, help="stories per news round")
+    parser.add_argument('--memory', action='store_true', help="trace peak Python memory (slower) instead of reporting max RSS")
+    parser.add_argument('--updates', type=int, default=200, help="updates per serving mode")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--verify', type=lambda value: [item.upper() for item in value.split(',') if item], default=[], help="symbols to check resampled bars against live exchange candles")
+    args = parser.parse_args()
+    telegram_bot.load_config()
+    telegram_bot.setup_logging()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    for name in args.benchmarks or sorted(BENCHMARKS):
+        BENCHMARKS[name](args)
+
+
+if __name__ == "__main__":
+    main()
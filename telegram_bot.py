@@ -1,23 +1,79 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+import asyncio
+import atexit
+import bisect
+from collections import OrderedDict, deque
+import contextlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import argparse
+import hmac
+import secrets
+import signal
+import multiprocessing
+import socket
+import zlib
 import sqlite3
+import threading
 import datetime
+import functools
+import heapq
+import importlib
+import itertools
+import json
 import os
-import requests
-import feedparser
-from tradingview_ta import TA_Handler, Interval, Exchange
-import ccxt
-import pandas as pd
-import talib
-import time
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 import telegram.error
 import logging
-from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
+import logging.handlers
+import queue
+import sys
+from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton, InlineQueryResultArticle, InputTextMessageContent
+from telegram.helpers import escape_markdown
+from telegram.ext import Application, CommandHandler, CallbackQueryHandler, InlineQueryHandler, ContextTypes
+
+# --- Lazy Imports ---
+STARTUP_TIMINGS = {}
+
+class LazyModule:
+    # Heavy client libraries are imported on first use (or preloaded off the event loop), so a cold
+    # start only pays for what it needs before the first poll.
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def preload(self):
+        if self._module is None:
+            started = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            STARTUP_TIMINGS.setdefault(f"import {self._name}", time.perf_counter() - started)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self.preload(), attr)
+
+aiohttp = LazyModule('aiohttp')
+web = LazyModule('aiohttp.web')
+feedparser = LazyModule('feedparser')
+tradingview_ta = LazyModule('tradingview_ta')
+ccxt_async = LazyModule('ccxt.async_support')
+
+@contextlib.contextmanager
+def startup_phase(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STARTUP_TIMINGS[name] = time.perf_counter() - started
 
 # --- Bot Configuration ---
-TOKEN = os.getenv('TOKEN')
-ADMIN_USER_ID = int(os.getenv('ADMIN_USER_ID'))
+TOKEN = None
+ADMIN_USER_ID = 0
 CHANNEL_ID = os.getenv('CHANNEL_ID')
+CHANNEL_LANGUAGE = os.getenv('CHANNEL_LANGUAGE', 'ar')
 NEWS_RSS_URL = 'https://www.coindesk.com/arc/outboundfeeds/rss/?outputType=xml'
+NEWS_FEEDS = [url.strip() for url in os.getenv('NEWS_FEEDS', NEWS_RSS_URL).split(',') if url.strip()]  # URLs or local fixture files
 
 # === قم بتعديل هذه المعلومات ===
 BINANCE_WALLET_ADDRESS = "YOUR_BINANCE_WALLET_ADDRESS_HERE" # عنوان محفظة Binance الخاص بك
@@ -29,11 +85,1115 @@ SUBSCRIPTION_PRICES = {
 ADMIN_USERNAME = "mohammadksa9"
 # =================================
 
+def load_config():
+    # Required settings are resolved at startup rather than import, so the module imports without them.
+    global TOKEN, ADMIN_USER_ID
+    TOKEN = os.getenv('TOKEN')
+    ADMIN_USER_ID = int(os.getenv('ADMIN_USER_ID') or 0)
+
+# --- Logging ---
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.getenv('LOG_LEVELS', 'httpx=WARNING')  # per subsystem or library logger, e.g. "scan=DEBUG,broadcast=WARNING"
+LOG_RATE_LIMIT_SECONDS = float(os.getenv('LOG_RATE_LIMIT_SECONDS', '60'))  # repeated warnings/errors per message
+LOG_SUBSYSTEMS = ('bot', 'scan', 'exchange', 'broadcast', 'news', 'stream', 'handlers')
+
+def kv(**fields):
+    return {'fields': fields}
+
+def format_value(value):
+    if isinstance(value, float):
+        value = f"{value:.3f}"
+    value = str(value)
+    if not value or any(char in value for char in ' "=\n'):
+        return json.dumps(value, ensure_ascii=False)
+    return value
+
+class KeyValueFormatter(logging.Formatter):
+    # One line per record: ts=... level=... logger=... msg="..." followed by the record's fields.
+    def format(self, record):
+        parts = [
+            f"ts={self.formatTime(record, '%Y-%m-%dT%H:%M:%S')}",
+            f"level={record.levelname}",
+            f"logger={record.name}",
+            f"msg={format_value(record.getMessage())}",
+        ]
+        parts.extend(f"{key}={format_value(value)}" for key, value in getattr(record, 'fields', {}).items())
+        if record.exc_info:
+            parts.append(f"exc={format_value(self.formatException(record.exc_info))}")
+        return ' '.join(parts)
+
+class RateLimitFilter(logging.Filter):
+    # Repeated warnings and errors (same logger and message) pass at most once per interval; the next
+    # record that passes carries the number suppressed in between.
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self._seen = {}
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING or not self.interval:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        entry = self._seen.get(key)
+        if entry is not None and now - entry[0] < self.interval:
+            entry[1] += 1
+            return False
+        if entry is not None and entry[1]:
+            record.fields = {**getattr(record, 'fields', {}), 'suppressed': entry[1]}
+        self._seen[key] = [now, 0]
+        return True
+
+def logger_name(name):
+    return f"cryptobot.{name}" if name in LOG_SUBSYSTEMS else name
+
+def setup_logging():
+    # Callers only enqueue records; formatting and the stdout write happen on the listener thread.
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT_SECONDS))
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(KeyValueFormatter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(LOG_LEVEL.upper())
+    for item in LOG_LEVELS.split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            logging.getLogger(logger_name(name.strip())).setLevel(level.strip().upper())
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+BOT_LOG = logging.getLogger(logger_name('bot'))
+SCAN_LOG = logging.getLogger(logger_name('scan'))
+EXCHANGE_LOG = logging.getLogger(logger_name('exchange'))
+BROADCAST_LOG = logging.getLogger(logger_name('broadcast'))
+NEWS_LOG = logging.getLogger(logger_name('news'))
+STREAM_LOG = logging.getLogger(logger_name('stream'))
+HANDLER_LOG = logging.getLogger(logger_name('handlers'))
+
+# --- Metrics ---
+METRICS_WINDOW = int(os.getenv('METRICS_WINDOW', '1024'))  # latency samples kept per series
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # Prometheus text endpoint; 0 disables it
+METRICS_PREFIX = 'cryptobot_'
+METRICS_QUANTILES = (0.5, 0.95, 0.99)
+
+class LatencyHistogram:
+    # Recent samples in a fixed-size ring buffer for quantiles, plus lifetime count and sum.
+    def __init__(self, window):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+
+    def quantiles(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return {q: 0.0 for q in METRICS_QUANTILES}
+        return {q: samples[min(len(samples) - 1, int(len(samples) * q))] for q in METRICS_QUANTILES}
+
+class Metrics:
+    # In-process counters and latency histograms. Worker threads record into it too, hence the lock.
+    def __init__(self, window=None):
+        self.window = window or METRICS_WINDOW
+        self.started_at = time.time()
+        self.counters = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = LatencyHistogram(self.window)
+            histogram.observe(seconds)
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.inc(f"{name}_errors", **labels)
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {key: (histogram.count, histogram.total, histogram.quantiles()) for key, histogram in self.histograms.items()}
+        return counters, histograms
+
+METRICS = Metrics()
+
+def format_labels(labels, **extra):
+    items = list(labels) + list(extra.items())
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in items)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + '}'
+
+def render_prometheus(gauges):
+    counters, histograms = METRICS.snapshot()
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {METRICS_PREFIX}{name}_total counter")
+        lines.extend(f"{METRICS_PREFIX}{name}_total{format_labels(labels)} {value}" for (counter, labels), value in sorted(counters.items()) if counter == name)
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# TYPE {METRICS_PREFIX}{name} summary")
+        for (histogram, labels), (count, total, quantiles) in sorted(histograms.items()):
+            if histogram != name:
+                continue
+            lines.extend(f"{METRICS_PREFIX}{name}{format_labels(labels, quantile=q)} {value:.6f}" for q, value in quantiles.items())
+            lines.append(f"{METRICS_PREFIX}{name}_sum{format_labels(labels)} {total:.6f}")
+            lines.append(f"{METRICS_PREFIX}{name}_count{format_labels(labels)} {count}")
+    for name, value in sorted(gauges.items()):
+        lines.append(f"# TYPE {METRICS_PREFIX}{name} gauge")
+        lines.append(f"{METRICS_PREFIX}{name} {value}")
+    return '\n'.join(lines) + '\n'
+
+def render_metrics_report(gauges):
+    counters, histograms = METRICS.snapshot()
+    uptime = time.time() - METRICS.started_at
+    lines = [f"uptime {uptime / 3600:.1f}h"]
+    lines.append("latency (count  p50 / p95 / p99 ms)")
+    for (name, labels), (count, _, quantiles) in sorted(histograms.items()):
+        values = ' / '.join(f"{quantiles[q] * 1000:.1f}" for q in METRICS_QUANTILES)
+        lines.append(f"  {name}{format_labels(labels)}  {count}  {values}")
+    lines.append("counters")
+    lines.extend(f"  {name}{format_labels(labels)}  {value}" for (name, labels), value in sorted(counters.items()))
+    lines.append("gauges")
+    lines.extend(f"  {name}  {value:.3g}" if isinstance(value, float) else f"  {name}  {value}" for name, value in sorted(gauges.items()))
+    return '\n'.join(lines)
+
+# --- Blocking Call Executors ---
+EXECUTOR_WORKERS = {
+    'network': int(os.getenv('NETWORK_WORKERS', '16')),
+    'compute': int(os.getenv('COMPUTE_WORKERS', str(os.cpu_count() or 2))),
+    'db': 1,  # the SQLite connection belongs to a single thread
+    'process': int(os.getenv('SCAN_PROCESSES', '0')),  # local process pool for indicator math; 0 keeps it in-process
+}
+EXECUTOR_TIMEOUTS = {
+    'network': float(os.getenv('NETWORK_CALL_TIMEOUT', '30')),
+    'compute': float(os.getenv('COMPUTE_CALL_TIMEOUT', '60')),
+    'db': float(os.getenv('DB_CALL_TIMEOUT', '30')),
+    'process': float(os.getenv('COMPUTE_CALL_TIMEOUT', '60')),
+}
+PROCESS_POOLS = {'process'}
+
+class ExecutorStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.queue_wait = 0.0
+        self.max_queue_wait = 0.0
+        self.run_time = 0.0
+        self.max_run_time = 0.0
+        self.queued = 0  # submitted but not started (process pools: not finished)
+
+    def record(self, queue_wait, run_time, failed):
+        self.calls += 1
+        self.errors += failed
+        self.queue_wait += queue_wait
+        self.max_queue_wait = max(self.max_queue_wait, queue_wait)
+        self.run_time += run_time
+        self.max_run_time = max(self.max_run_time, run_time)
+
+    def summary(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'cancelled': self.cancelled,
+            'avg_queue_wait_ms': self.queue_wait / self.calls * 1000 if self.calls else 0.0,
+            'max_queue_wait_ms': self.max_queue_wait * 1000,
+            'avg_run_ms': self.run_time / self.calls * 1000 if self.calls else 0.0,
+            'max_run_ms': self.max_run_time * 1000,
+            'queued': self.queued,
+        }
+
+class Executors:
+    # Named, bounded thread pools for blocking library calls, so a slow network call cannot starve
+    # database work and neither can starve the event loop.
+    def __init__(self, workers, timeouts):
+        self.workers = workers
+        self.timeouts = timeouts
+        self._pools = {}
+        self._stats = {name: ExecutorStats() for name in workers}
+        self._lock = threading.Lock()
+
+    def pool(self, name):
+        with self._lock:
+            if name not in self._pools:
+                if name in PROCESS_POOLS:
+                    # spawn rather than fork: this process already runs executor and logging threads.
+                    self._pools[name] = ProcessPoolExecutor(max_workers=self.workers[name], mp_context=multiprocessing.get_context('spawn'))
+                else:
+                    self._pools[name] = ThreadPoolExecutor(max_workers=self.workers[name], thread_name_prefix=f"{name}-worker")
+            return self._pools[name]
+
+    def submit(self, name, func, *args, **kwargs):
+        stats = self._stats[name]
+        submitted = time.perf_counter()
+        with self._lock:
+            stats.queued += 1
+        if name in PROCESS_POOLS:
+            # Work crosses the process boundary as-is, so only the round trip can be timed.
+            def record(future):
+                with self._lock:
+                    stats.queued -= 1
+                    stats.record(0.0, time.perf_counter() - submitted, not future.cancelled() and future.exception() is not None)
+            future = self.pool(name).submit(func, *args, **kwargs)
+            future.add_done_callback(record)
+            return future
+
+        def timed():
+            started = time.perf_counter()
+            with self._lock:
+                stats.queued -= 1
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                finished = time.perf_counter()
+                with self._lock:
+                    stats.record(started - submitted, finished - started, failed)
+                METRICS.observe('executor_queue_wait_seconds', started - submitted, pool=name)
+
+        def dropped(future):
+            # Cancelled while still queued: timed() never ran.
+            if future.cancelled():
+                with self._lock:
+                    stats.queued -= 1
+
+        future = self.pool(name).submit(timed)
+        future.add_done_callback(dropped)
+        return future
+
+    async def run(self, name, func, *args, timeout=None, **kwargs):
+        # Cancelling the awaiting task (or hitting the timeout) drops the call if it is still queued;
+        # a call already running in a thread finishes in the background and its result is discarded.
+        future = self.submit(name, func, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout or self.timeouts[name])
+        except asyncio.TimeoutError:
+            self._stats[name].timeouts += 1
+            raise
+        except asyncio.CancelledError:
+            self._stats[name].cancelled += 1
+            raise
+
+    def stats(self):
+        return {name: stats.summary() for name, stats in self._stats.items()}
+
+    def shutdown(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+EXECUTORS = Executors(EXECUTOR_WORKERS, EXECUTOR_TIMEOUTS)
+
+# --- Scan Engine ---
+SCAN_CONCURRENCY = int(os.getenv('SCAN_CONCURRENCY', '8'))
+TRADINGVIEW_RATE_LIMIT = float(os.getenv('TRADINGVIEW_RATE_LIMIT', '5'))  # requests per second
+BINANCE_RATE_LIMIT = float(os.getenv('BINANCE_RATE_LIMIT', '10'))  # requests per second
+TRADINGVIEW_BATCH_SIZE = int(os.getenv('TRADINGVIEW_BATCH_SIZE', '50'))  # symbols per scan request
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens=1):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+RATE_LIMITERS = {
+    'tradingview': TokenBucket(TRADINGVIEW_RATE_LIMIT),
+    'binance': TokenBucket(BINANCE_RATE_LIMIT),
+}
+
+async def call_upstream(upstream, func, *args, **kwargs):
+    # Blocking client libraries run on the network pool so the event loop keeps serving updates.
+    await RATE_LIMITERS[upstream].acquire()
+    with METRICS.timer('upstream_call_seconds', upstream=upstream, call=func.__name__):
+        return await EXECUTORS.run('network', func, *args, **kwargs)
+
+async def run_concurrently(jobs, worker, concurrency=None):
+    semaphore = asyncio.Semaphore(concurrency or SCAN_CONCURRENCY)
+
+    async def run(job):
+        async with semaphore:
+            try:
+                return job, await worker(*job), None
+            except Exception as e:
+                return job, None, e
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(run(job) for job in jobs))
+    return results, time.perf_counter() - started
+
+def chunked(items, size):
+    items = list(items)
+    return [tuple(items[i:i + size]) for i in range(0, len(items), size)]
+
+def get_tradingview_analyses(timeframe_str, symbols):
+    return tradingview_ta.get_multiple_analysis(
+        screener="crypto",
+        interval=TIMEFRAMES_ENUM[timeframe_str],
+        symbols=[f"BINANCE:{symbol}" for symbol in symbols],
+    )
+
+async def fetch_recommendations(timeframe_str, symbols):
+    analyses = await call_upstream('tradingview', get_tradingview_analyses, timeframe_str, symbols)
+    recommendations = {}
+    for symbol in symbols:
+        analysis = analyses.get(f"BINANCE:{symbol}")
+        recommendations[symbol] = analysis.summary['RECOMMENDATION'] if analysis and analysis.summary else None
+    return recommendations
+
+async def fetch_recommendation(symbol, timeframe_str):
+    recommendations = await get_recommendation_source()(timeframe_str, [symbol])
+    if recommendations[symbol] is None:
+        # Unknown symbols come back without an analysis; fail like TA_Handler did so /analyze reports the error.
+        raise ValueError(f"no analysis for {symbol} on {timeframe_str}")
+    return recommendations[symbol]
+
+async def scan_recommendations(pairs):
+    # One TradingView scan request per (timeframe, chunk of symbols) instead of one per pair.
+    symbols_by_timeframe = {}
+    for symbol, timeframe_str in pairs:
+        symbols_by_timeframe.setdefault(timeframe_str, set()).add(symbol)
+    batches = [(timeframe_str, chunk) for timeframe_str, symbols in sorted(symbols_by_timeframe.items()) for chunk in chunked(sorted(symbols), TRADINGVIEW_BATCH_SIZE)]
+    results, elapsed = await run_concurrently(batches, get_recommendation_source())
+
+    recommendations = {}
+    errors = {}
+    for (timeframe_str, chunk), batch, error in results:
+        for symbol in chunk:
+            if error:
+                errors[(symbol, timeframe_str)] = error
+            else:
+                recommendations[(symbol, timeframe_str)] = batch[symbol]
+    return recommendations, errors, elapsed
+
+# --- Exchange Client ---
+MARKETS_REFRESH_INTERVAL = int(os.getenv('MARKETS_REFRESH_INTERVAL', '3600'))  # seconds
+EXCHANGE = None
+
+def create_exchange():
+    # A single async client keeps one pooled keep-alive HTTP session and ccxt's own rate-limit accounting.
+    return ccxt_async.binance({'enableRateLimit': True})
+
+def get_exchange():
+    global EXCHANGE
+    if EXCHANGE is None:
+        EXCHANGE = create_exchange()
+    return EXCHANGE
+
+def set_exchange(exchange):
+    # Lets tests and benchmarks plug in a local stub exposing the same async methods.
+    global EXCHANGE
+    EXCHANGE = exchange
+
+async def exchange_call(method, *args, **kwargs):
+    await RATE_LIMITERS['binance'].acquire()
+    with METRICS.timer('upstream_call_seconds', upstream='binance', call=method):
+        return await getattr(get_exchange(), method)(*args, **kwargs)
+
+async def init_exchange():
+    # ccxt is the single largest import; load it on a worker thread instead of stalling the event loop.
+    await EXECUTORS.run('compute', ccxt_async.preload)
+    try:
+        markets = await get_exchange().load_markets()
+        EXCHANGE_LOG.info("markets loaded", extra=kv(markets=len(markets), symbols=SYMBOL_UNIVERSE.load(markets)))
+    except Exception as e:
+        EXCHANGE_LOG.warning("market load failed, retrying on first use", extra=kv(error=e))
+
+async def refresh_markets(context: ContextTypes.DEFAULT_TYPE):
+    try:
+        SYMBOL_UNIVERSE.load(await get_exchange().load_markets(reload=True))
+    except Exception as e:
+        EXCHANGE_LOG.warning("market refresh failed", extra=kv(error=e))
+
+async def close_exchange():
+    global EXCHANGE
+    if EXCHANGE is not None:
+        await EXCHANGE.close()
+        EXCHANGE = None
+
+# --- Symbol Universe ---
+DEFAULT_SYMBOLS = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "ADAUSDT", "XRPUSDT"]  # offered before markets load, then pinned first
+SYMBOL_QUOTES = {quote.strip().upper() for quote in os.getenv('SYMBOL_QUOTES', 'USDT').split(',') if quote.strip()}
+SETTINGS_PAGE_SIZE = int(os.getenv('SETTINGS_PAGE_SIZE', '10'))  # symbol buttons per settings page
+SYMBOL_SEARCH_LIMIT = int(os.getenv('SYMBOL_SEARCH_LIMIT', '20'))  # results per /symbols reply or inline query (max 50)
+INLINE_CACHE_SECONDS = int(os.getenv('INLINE_CACHE_SECONDS', '300'))
+
+def normalize_symbol_query(text):
+    # 'btc/usdt', 'BTC-USDT' and 'btcusdt' all search for BTCUSDT.
+    return ''.join(char for char in text.upper() if char.isalnum())
+
+class SymbolUniverse:
+    # Tradable spot pairs from the exchange market list, keyed by exchange id (BTCUSDT). The sorted id list is
+    # the prefix index: all ids sharing a prefix form one contiguous slice found with two binary searches.
+    def __init__(self):
+        self.loaded = False
+        self._index({symbol: symbol for symbol in DEFAULT_SYMBOLS})
+
+    def _index(self, names):
+        pinned = [symbol for symbol in DEFAULT_SYMBOLS if symbol in names]
+        self.names = names
+        self.sorted = sorted(names)
+        self.menu_order = pinned + [symbol for symbol in self.sorted if symbol not in pinned]
+
+    def load(self, markets):
+        names = {
+            market['id']: market['symbol'] for market in markets.values()
+            if market.get('spot') and market.get('active') is not False and market.get('quote') in SYMBOL_QUOTES
+        }
+        # An empty or failed market list keeps the previous universe.
+        if names:
+            self._index(names)
+            self.loaded = True
+        return len(names)
+
+    def __len__(self):
+        return len(self.sorted)
+
+    def is_tradable(self, symbol):
+        # Until markets load every symbol is accepted, so a slow exchange never blocks settings or scans.
+        return not self.loaded or symbol in self.names
+
+    def unified(self, symbol):
+        return self.names.get(symbol) if self.loaded else None
+
+    def search(self, prefix, limit=None):
+        prefix = normalize_symbol_query(prefix)
+        start = bisect.bisect_left(self.sorted, prefix)
+        end = bisect.bisect_left(self.sorted, prefix + '\x7f', start)
+        # Shortest ids first, so 'BTC' leads with BTCUSDT rather than BTCDOMUSDT.
+        matches = sorted(self.sorted[start:end], key=lambda symbol: (len(symbol), symbol))
+        return matches[:limit], end - start
+
+    def page(self, number, size=None):
+        size = size or SETTINGS_PAGE_SIZE
+        pages = max(1, -(-len(self.menu_order) // size))
+        number = min(max(number, 0), pages - 1)
+        return self.menu_order[number * size:(number + 1) * size], number, pages
+
+SYMBOL_UNIVERSE = SymbolUniverse()
+
+# --- Candle Store ---
+CANDLE_HISTORY_DEPTH = int(os.getenv('CANDLE_HISTORY_DEPTH', '250'))  # bars kept per (symbol, timeframe)
+CANDLE_REFRESH_SECONDS = float(os.getenv('CANDLE_REFRESH_SECONDS', '15'))
+CANDLE_STORE_MAX_SERIES = int(os.getenv('CANDLE_STORE_MAX_SERIES', '1000'))  # least recently updated series are evicted
+# Higher timeframes are built from one base series per symbol instead of being downloaded separately.
+# Set RESAMPLE_TIMEFRAMES to an empty string to fetch every timeframe from the exchange. A timeframe whose
+# resampled history would be shorter than the longest moving average is fetched natively regardless.
+RESAMPLE_BASE_TIMEFRAME = os.getenv('RESAMPLE_BASE_TIMEFRAME', '15m')
+RESAMPLE_TIMEFRAMES = {timeframe for timeframe in os.getenv('RESAMPLE_TIMEFRAMES', '1h').split(',') if timeframe}
+BASE_HISTORY_DEPTH = int(os.getenv('BASE_HISTORY_DEPTH', str(16 * 96)))  # 16 days of 15m bars
+OHLCV_FIELDS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+TIMEFRAME_MS = {
+    '15m': 15 * 60 * 1000,
+    '1h': 60 * 60 * 1000,
+    '4h': 4 * 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+}
+EXCHANGE_OHLCV_LIMIT = 1000
+
+def bar_is_closed(timestamp, timeframe, now_ms=None):
+    now_ms = now_ms if now_ms is not None else time.time() * 1000
+    return timestamp + TIMEFRAME_MS[timeframe] <= now_ms
+
+class CandleSeries:
+    # Bars live in a buffer twice the history depth; once it fills up the newest bars slide back to the
+    # front, so appends stay amortised O(1) and every column is a contiguous view for TA-Lib/NumPy.
+    def __init__(self, timeframe, depth):
+        self.timeframe = timeframe
+        self.depth = depth
+        self.updated_at = 0.0
+        self._data = np.zeros((len(OHLCV_FIELDS), depth * 2), dtype=np.float64)
+        self._start = 0
+        self._end = 0
+
+    def __len__(self):
+        return self._end - self._start
+
+    @property
+    def last_timestamp(self):
+        if self._end == self._start:
+            return None
+        return int(self._data[0, self._end - 1])
+
+    def append(self, rows):
+        for row in rows:
+            row = np.asarray(row, dtype=np.float64)
+            last_timestamp = self.last_timestamp
+            if last_timestamp is not None and row[0] < last_timestamp:
+                continue
+            if last_timestamp is not None and row[0] == last_timestamp:
+                # The last bar was still forming when we stored it: overwrite it with the newer values.
+                self._data[:, self._end - 1] = row
+                continue
+            if self._end == self._data.shape[1]:
+                keep = self.depth - 1
+                self._data[:, :keep] = self._data[:, self._end - keep:self._end]
+                self._start, self._end = 0, keep
+            self._data[:, self._end] = row
+            self._end += 1
+            if self._end - self._start > self.depth:
+                self._start = self._end - self.depth
+
+    def is_last_closed(self, now_ms=None):
+        return self.last_timestamp is not None and bar_is_closed(self.last_timestamp, self.timeframe, now_ms)
+
+    def column(self, field, closed_only=False):
+        end = self._end
+        if closed_only and not self.is_last_closed():
+            end -= 1
+        return self._data[OHLCV_FIELDS.index(field), self._start:max(self._start, end)]
+
+    def arrays(self, closed_only=False):
+        return {field: self.column(field, closed_only) for field in OHLCV_FIELDS}
+
+class ResampledSeries:
+    # Read-only series with the CandleSeries interface, derived from a base series.
+    def __init__(self, timeframe, arrays, updated_at):
+        self.timeframe = timeframe
+        self.updated_at = updated_at
+        self._arrays = arrays
+
+    def __len__(self):
+        return len(self._arrays['timestamp'])
+
+    @property
+    def last_timestamp(self):
+        return int(self._arrays['timestamp'][-1]) if len(self) else None
+
+    def is_last_closed(self, now_ms=None):
+        return self.last_timestamp is not None and bar_is_closed(self.last_timestamp, self.timeframe, now_ms)
+
+    def column(self, field, closed_only=False):
+        column = self._arrays[field]
+        if closed_only and len(column) and not self.is_last_closed():
+            return column[:-1]
+        return column
+
+    def arrays(self, closed_only=False):
+        return {field: self.column(field, closed_only) for field in OHLCV_FIELDS}
+
+def resample_ohlcv(arrays, timeframe):
+    # Vectorised OHLCV aggregation into UTC-aligned buckets of the target timeframe. A leading bucket that the
+    # history only partly covers is dropped; the trailing one is kept and is still forming until it closes.
+    timestamps = arrays['timestamp']
+    target_ms = TIMEFRAME_MS[timeframe]
+    empty = {field: np.empty(0) for field in OHLCV_FIELDS}
+    if not len(timestamps):
+        return empty
+    buckets = timestamps.astype(np.int64) // target_ms
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    if timestamps[0] != buckets[0] * target_ms:
+        starts = starts[1:]
+    if not len(starts):
+        return empty
+    first = starts[0]
+    offsets = starts - first
+    ends = np.r_[starts[1:], len(timestamps)]
+    return {
+        'timestamp': (buckets[starts] * target_ms).astype(np.float64),
+        'open': arrays['open'][starts],
+        'high': np.maximum.reduceat(arrays['high'][first:], offsets),
+        'low': np.minimum.reduceat(arrays['low'][first:], offsets),
+        'close': arrays['close'][ends - 1],
+        'volume': np.add.reduceat(arrays['volume'][first:], offsets),
+    }
+
+def source_timeframe(timeframe):
+    if timeframe not in RESAMPLE_TIMEFRAMES or RESAMPLE_BASE_TIMEFRAME not in TIMEFRAME_MS:
+        return timeframe
+    ratio, remainder = divmod(TIMEFRAME_MS[timeframe], TIMEFRAME_MS[RESAMPLE_BASE_TIMEFRAME])
+    if remainder or BASE_HISTORY_DEPTH // ratio < max(MA_PERIODS):
+        return timeframe
+    return RESAMPLE_BASE_TIMEFRAME
+
+class CandleStore:
+    def __init__(self, depth=None, base_depth=None):
+        self.depth = depth or CANDLE_HISTORY_DEPTH
+        self.base_depth = max(base_depth or BASE_HISTORY_DEPTH, self.depth)
+        self._series = OrderedDict()
+        self._resampled = {}
+        self._locks = {}
+
+    def _depth_for(self, timeframe):
+        return self.base_depth if timeframe == RESAMPLE_BASE_TIMEFRAME and RESAMPLE_TIMEFRAMES else self.depth
+
+    def get(self, symbol, timeframe):
+        if source_timeframe(timeframe) != timeframe:
+            return self._resample(symbol, timeframe)
+        return self._series.get((symbol, timeframe))
+
+    def _resample(self, symbol, timeframe):
+        base = self._series.get((symbol, source_timeframe(timeframe)))
+        if base is None:
+            return None
+        cached = self._resampled.get((symbol, timeframe))
+        if cached is not None and cached.updated_at == base.updated_at:
+            return cached
+        arrays = resample_ohlcv(base.arrays(), timeframe)
+        series = ResampledSeries(timeframe, {field: values[-self.depth:] for field, values in arrays.items()}, base.updated_at)
+        self._resampled[(symbol, timeframe)] = series
+        return series
+
+    async def _fetch_history(self, symbol, timeframe, bars):
+        if bars <= EXCHANGE_OHLCV_LIMIT:
+            return await exchange_call('fetch_ohlcv', symbol, timeframe, limit=bars)
+        since = int(time.time() * 1000) - bars * TIMEFRAME_MS[timeframe]
+        rows = []
+        while len(rows) < bars:
+            page = await exchange_call('fetch_ohlcv', symbol, timeframe, since=since, limit=EXCHANGE_OHLCV_LIMIT)
+            if not page:
+                break
+            rows.extend(page)
+            since = int(page[-1][0]) + TIMEFRAME_MS[timeframe]
+            if len(page) < EXCHANGE_OHLCV_LIMIT:
+                break
+        return rows
+
+    async def update(self, symbol, timeframe):
+        base_timeframe = source_timeframe(timeframe)
+        key = (symbol, base_timeframe)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                series = self._series.get(key)
+                if series is None or time.monotonic() - series.updated_at >= CANDLE_REFRESH_SECONDS:
+                    self._store(key, await self._refresh(symbol, base_timeframe, series))
+        except Exception:
+            # Unknown symbols must not leave anything behind.
+            if key not in self._series:
+                self._locks.pop(key, None)
+            raise
+        return self.get(symbol, timeframe)
+
+    async def _refresh(self, symbol, timeframe, series):
+        if series is not None:
+            # Fetching from the last stored bar re-reads it in case it was still forming.
+            missing = int((time.time() * 1000 - series.last_timestamp) // TIMEFRAME_MS[timeframe]) + 1
+            # Past one request, fetching from the last bar would return the oldest missing bars, not the newest: re-seed.
+            if missing <= min(series.depth, EXCHANGE_OHLCV_LIMIT):
+                series.append(await exchange_call('fetch_ohlcv', symbol, timeframe, since=series.last_timestamp, limit=max(missing, 1)))
+                series.updated_at = time.monotonic()
+                return series
+        rows = await self._fetch_history(symbol, timeframe, self._depth_for(timeframe))
+        if not rows:
+            raise ValueError(f"no candles for {symbol} {timeframe}")
+        series = CandleSeries(timeframe, self._depth_for(timeframe))
+        series.append(rows)
+        series.updated_at = time.monotonic()
+        return series
+
+    def _store(self, key, series):
+        self._series[key] = series
+        self._series.move_to_end(key)
+        while len(self._series) > CANDLE_STORE_MAX_SERIES:
+            (symbol, timeframe), _ = self._series.popitem(last=False)
+            lock = self._locks.get((symbol, timeframe))
+            if lock is not None and not lock.locked():
+                del self._locks[(symbol, timeframe)]
+            for derived in RESAMPLE_TIMEFRAMES:
+                if source_timeframe(derived) == timeframe:
+                    self._resampled.pop((symbol, derived), None)
+
+    def apply(self, symbol, timeframe, rows):
+        # Push streamed bars into an already seeded series; unseeded pairs get their history from update().
+        series = self._series.get((symbol, timeframe))
+        if series is None or not len(series):
+            return None
+        series.append(rows)
+        series.updated_at = time.monotonic()
+        return series
+
+    async def atr(self, symbol, timeframe, period=14):
+        series = await self.update(symbol, timeframe)
+        return average_true_range(series.column('high'), series.column('low'), series.column('close'), period)
+
+def average_true_range(high, low, close, period=14):
+    # Wilder's ATR as TA-Lib computes it: seeded with the mean of the first `period` true ranges.
+    true_range = np.maximum(high[1:], close[:-1]) - np.minimum(low[1:], close[:-1])
+    if len(true_range) < period:
+        return np.nan
+    value = true_range[:period].mean()
+    for current in true_range[period:]:
+        value = (value * (period - 1) + current) / period
+    return value
+
+async def verify_resampled_candles(symbol, timeframe, bars=50, store=None):
+    # Compares derived bars with the exchange's own candles for the same timeframe, bar for bar.
+    store = store or CANDLE_STORE
+    derived = await store.update(symbol, timeframe)
+    exchange_rows = np.asarray(await exchange_call('fetch_ohlcv', symbol, timeframe, limit=bars), dtype=np.float64)
+    derived_arrays = derived.arrays(closed_only=True)
+    index = {int(timestamp): i for i, timestamp in enumerate(derived_arrays['timestamp'])}
+    compared = 0
+    mismatches = []
+    for row in exchange_rows:
+        if not bar_is_closed(row[0], timeframe) or int(row[0]) not in index:
+            continue
+        i = index[int(row[0])]
+        derived_row = np.array([derived_arrays[field][i] for field in OHLCV_FIELDS])
+        compared += 1
+        if not np.allclose(derived_row, row, rtol=1e-9, atol=1e-9):
+            mismatches.append((int(row[0]), derived_row.tolist(), row.tolist()))
+    return {'compared': compared, 'mismatches': mismatches}
+
+CANDLE_STORE = CandleStore()
+
+# --- Ticker Snapshots ---
+TICKER_TTL_SECONDS = float(os.getenv('TICKER_TTL_SECONDS', '10'))
+# Above this many symbols one unfiltered request (the same request weight on Binance) replaces a symbol list in the URL.
+TICKER_BULK_THRESHOLD = int(os.getenv('TICKER_BULK_THRESHOLD', '100'))
+
+def unified_symbol(symbol):
+    known = SYMBOL_UNIVERSE.unified(symbol)
+    if known:
+        return known
+    try:
+        return get_exchange().market(symbol)['symbol']
+    except Exception:
+        return symbol
+
+class TickerCache:
+    def __init__(self, ttl=None):
+        self.ttl = ttl or TICKER_TTL_SECONDS
+        self.monitored = set()
+        self.hits = 0
+        self.misses = 0
+        self._tickers = {}
+        self._inflight = {}
+
+    def set_monitored(self, symbols):
+        self.monitored = set(symbols)
+
+    def _fresh(self, symbol):
+        entry = self._tickers.get(symbol)
+        if entry and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+        return None
+
+    async def _coalesce(self, key, factory):
+        # Concurrent lookups for the same key await one shared upstream request.
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _refresh_monitored(self):
+        symbols = sorted(self.monitored)
+        if not symbols:
+            return
+        tickers = await exchange_call('fetch_tickers', symbols if len(symbols) <= TICKER_BULK_THRESHOLD else None)
+        fetched_at = time.monotonic()
+        for symbol in symbols:
+            ticker = tickers.get(symbol) or tickers.get(unified_symbol(symbol))
+            if ticker:
+                self._tickers[symbol] = (fetched_at, ticker)
+
+    async def _fetch_one(self, symbol):
+        ticker = await exchange_call('fetch_ticker', symbol)
+        self._tickers[symbol] = (time.monotonic(), ticker)
+        return ticker
+
+    async def refresh(self):
+        await self._coalesce('*', self._refresh_monitored)
+
+    async def get(self, symbol):
+        ticker = self._fresh(symbol)
+        if ticker is not None:
+            self.hits += 1
+            return ticker
+        self.misses += 1
+
+        if symbol in self.monitored:
+            try:
+                await self.refresh()
+            except Exception as e:
+                EXCHANGE_LOG.warning("bulk ticker refresh failed, fetching single ticker", extra=kv(symbol=symbol, error=e))
+            ticker = self._fresh(symbol)
+            if ticker is not None:
+                return ticker
+        return await self._coalesce(symbol, lambda: self._fetch_one(symbol))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'cached_symbols': len(self._tickers),
+        }
+
+TICKER_CACHE = TickerCache()
+
+# --- Local Indicator Engine ---
+SIGNAL_ENGINE = os.getenv('SIGNAL_ENGINE', 'tradingview')  # 'tradingview' or 'local'
+MA_PERIODS = (10, 20, 30, 50, 100, 200)
+
+def stack_series(columns, length):
+    # Right-align every symbol's column into one (symbols x length) matrix; short histories are NaN-padded.
+    matrix = np.full((len(columns), length), np.nan)
+    for row, column in enumerate(columns):
+        column = column[-length:]
+        if len(column):
+            matrix[row, length - len(column):] = column
+    return matrix
+
+def rolling(matrix, period, reducer):
+    result = np.full(matrix.shape, np.nan)
+    if matrix.shape[1] >= period:
+        result[:, period - 1:] = reducer(sliding_window_view(matrix, period, axis=1), axis=-1)
+    return result
+
+def smoothed(matrix, alpha, period):
+    # Exponential smoothing along time, vectorised across symbols. As in TA-Lib, each row is seeded with the
+    # mean of its first `period` valid values, so a long average has no value until that much history exists.
+    result = np.full(matrix.shape, np.nan)
+    seeds = rolling(matrix, period, np.mean)
+    current = np.full(matrix.shape[0], np.nan)
+    for i in range(matrix.shape[1]):
+        current = np.where(np.isnan(current), seeds[:, i], alpha * matrix[:, i] + (1 - alpha) * current)
+        result[:, i] = current
+    return result
+
+def ema(matrix, period):
+    return smoothed(matrix, 2.0 / (period + 1), period)
+
+def rsi(close, period=14):
+    delta = np.diff(close, axis=1, prepend=np.nan)
+    gains = smoothed(np.where(delta > 0, delta, np.where(np.isnan(delta), np.nan, 0.0)), 1.0 / period, period)
+    losses = smoothed(np.where(delta < 0, -delta, np.where(np.isnan(delta), np.nan, 0.0)), 1.0 / period, period)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(losses == 0, 100.0, 100.0 - 100.0 / (1.0 + gains / losses))
+
+def stochastic(high, low, close, period=14, smooth_k=3, smooth_d=3):
+    highest = rolling(high, period, np.max)
+    lowest = rolling(low, period, np.min)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        raw_k = 100.0 * (close - lowest) / (highest - lowest)
+    k = rolling(raw_k, smooth_k, np.mean)
+    return k, rolling(k, smooth_d, np.mean)
+
+def vote(buy, sell):
+    # +1 / -1 / 0 per symbol; NaN comparisons are False, so missing data never votes.
+    return np.where(buy, 1, np.where(sell, -1, 0))
+
+def rating(votes, valid):
+    votes = np.array(votes)
+    counted = np.array(valid).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(counted > 0, votes.sum(axis=0) / counted, np.nan)
+
+def score_to_recommendation(score):
+    # Same thresholds tradingview_ta uses for its summary recommendation.
+    if score < -0.5:
+        return 'STRONG_SELL'
+    if score < -0.1:
+        return 'SELL'
+    if score <= 0.1:
+        return 'NEUTRAL'
+    if score <= 0.5:
+        return 'BUY'
+    return 'STRONG_BUY'
+
+def compute_local_recommendations(symbol_arrays, length=None):
+    # symbol_arrays: {symbol: {'high': ..., 'low': ..., 'close': ...}} -> {symbol: recommendation}
+    if not symbol_arrays:
+        return {}
+    symbols = list(symbol_arrays)
+    length = length or max(len(symbol_arrays[symbol]['close']) for symbol in symbols)
+    if length < 2:
+        return {symbol: None for symbol in symbols}
+    high = stack_series([symbol_arrays[symbol]['high'] for symbol in symbols], length)
+    low = stack_series([symbol_arrays[symbol]['low'] for symbol in symbols], length)
+    close = stack_series([symbol_arrays[symbol]['close'] for symbol in symbols], length)
+    last_close = close[:, -1]
+
+    ma_votes = []
+    ma_valid = []
+    for period in MA_PERIODS:
+        for average in (rolling(close, period, np.mean)[:, -1], ema(close, period)[:, -1]):
+            ma_votes.append(vote(average < last_close, average > last_close))
+            ma_valid.append(~np.isnan(average))
+
+    oscillator_votes = []
+    oscillator_valid = []
+    rsi_values = rsi(close)
+    rsi_now, rsi_prev = rsi_values[:, -1], rsi_values[:, -2]
+    oscillator_votes.append(vote((rsi_now < 30) & (rsi_prev < rsi_now), (rsi_now > 70) & (rsi_prev > rsi_now)))
+    oscillator_valid.append(~np.isnan(rsi_now) & ~np.isnan(rsi_prev))
+
+    macd_line = ema(close, 12) - ema(close, 26)
+    macd_signal = ema(macd_line, 9)
+    oscillator_votes.append(vote(macd_line[:, -1] > macd_signal[:, -1], macd_line[:, -1] < macd_signal[:, -1]))
+    oscillator_valid.append(~np.isnan(macd_line[:, -1]) & ~np.isnan(macd_signal[:, -1]))
+
+    k, d = stochastic(high, low, close)
+    k_now, d_now = k[:, -1], d[:, -1]
+    oscillator_votes.append(vote((k_now < 20) & (d_now < 20) & (k_now > d_now), (k_now > 80) & (d_now > 80) & (k_now < d_now)))
+    oscillator_valid.append(~np.isnan(k_now) & ~np.isnan(d_now))
+
+    # Like TradingView's Recommend.All: the moving-average and oscillator ratings are averaged separately,
+    # then with each other, so the twelve MA votes cannot outvote the oscillators.
+    ratings = np.array([rating(ma_votes, ma_valid), rating(oscillator_votes, oscillator_valid)])
+    available = (~np.isnan(ratings)).sum(axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.where(available > 0, np.nansum(ratings, axis=0) / available, np.nan)
+    return {symbol: score_to_recommendation(score) if not np.isnan(score) else None for symbol, score in zip(symbols, scores)}
+
+async def fetch_local_recommendations(timeframe_str, symbols):
+    results, _ = await run_concurrently([(symbol, timeframe_str) for symbol in symbols], CANDLE_STORE.update)
+    symbol_arrays = {}
+    for (symbol, _), series, error in results:
+        if error:
+            EXCHANGE_LOG.warning("candle update failed", extra=kv(symbol=symbol, timeframe=timeframe_str, error=error))
+        elif series is not None and len(series):
+            symbol_arrays[symbol] = {field: series.column(field).copy() for field in ('high', 'low', 'close')}
+    recommendations = await compute_recommendations(symbol_arrays)
+    return {symbol: recommendations.get(symbol) for symbol in symbols}
+
+async def compute_recommendations(symbol_arrays, processes=None):
+    # With SCAN_PROCESSES set, symbols are split evenly across the local process pool so the
+    # indicator math uses every core instead of competing with update handling for one GIL.
+    processes = EXECUTORS.workers['process'] if processes is None else processes
+    if processes < 2 or len(symbol_arrays) < 2:
+        return await EXECUTORS.run('compute', compute_local_recommendations, symbol_arrays)
+    symbols = sorted(symbol_arrays)
+    chunks = [symbols[i::processes] for i in range(processes)]
+    results = await asyncio.gather(*(
+        EXECUTORS.run('process', compute_local_recommendations, {symbol: symbol_arrays[symbol] for symbol in chunk})
+        for chunk in chunks if chunk
+    ))
+    recommendations = {}
+    for result in results:
+        recommendations.update(result)
+    return recommendations
+
+def get_recommendation_source():
+    return fetch_local_recommendations if SIGNAL_ENGINE == 'local' else fetch_recommendations
+
+def recommendation_to_signal(recommendation):
+    if recommendation in ['STRONG_BUY', 'BUY']:
+        return "BUY"
+    if recommendation in ['STRONG_SELL', 'SELL']:
+        return "SELL"
+    return None
+
 # --- Database & Subscription Management ---
-DATABASE_NAME = 'crypto_bot.db'
+DATABASE_NAME = os.getenv('DATABASE_NAME', 'crypto_bot.db')
+SIGNAL_HISTORY_RETENTION_DAYS = int(os.getenv('SIGNAL_HISTORY_RETENTION_DAYS', '90'))
 
-def setup_database():
-    conn = sqlite3.connect(DATABASE_NAME)
+class Database:
+    # One long-lived connection owned by the single-threaded db pool: handlers await their queries instead
+    # of blocking the event loop, and sqlite3's statement cache keeps the hot queries prepared.
+    PRAGMAS = (
+        'PRAGMA journal_mode=WAL',
+        'PRAGMA synchronous=NORMAL',
+        'PRAGMA temp_store=MEMORY',
+        'PRAGMA cache_size=-16000',
+        'PRAGMA busy_timeout=5000',
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, cached_statements=256)
+            for pragma in self.PRAGMAS:
+                self._conn.execute(pragma)
+        return self._conn
+
+    def _run(self, func, *args):
+        conn = self._connection()
+        try:
+            result = func(conn, *args)
+            conn.commit()
+            return result
+        except Exception:
+            conn.rollback()
+            raise
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def call(self, func, *args):
+        # Synchronous entry point for code that runs outside the event loop (startup, benchmarks).
+        return EXECUTORS.submit('db', self._run, func, *args).result()
+
+    async def run(self, func, *args):
+        with METRICS.timer('db_query_seconds'):
+            return await EXECUTORS.run('db', self._run, func, *args)
+
+    async def fetchone(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchone())
+
+    async def fetchall(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).fetchall())
+
+    async def execute(self, sql, params=()):
+        return await self.run(lambda conn: conn.execute(sql, params).rowcount)
+
+    async def executemany(self, sql, seq_of_params):
+        return await self.run(lambda conn: conn.executemany(sql, seq_of_params).rowcount)
+
+    async def transaction(self, statements):
+        # statements: iterable of (sql, params), committed together or not at all.
+        def run_all(conn):
+            for sql, params in statements:
+                conn.execute(sql, params)
+        await self.run(run_all)
+
+    async def close(self):
+        await EXECUTORS.run('db', self._close)
+
+DB = Database(DATABASE_NAME)
+
+def create_schema(conn):
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -61,65 +1221,226 @@ def setup_database():
     ''')
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS bot_status (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
             last_signal_scan TEXT,
             last_news_scan TEXT
         )
     ''')
-    conn.commit()
-    conn.close()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_subscriptions (
+            user_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            timeframe TEXT NOT NULL,
+            PRIMARY KEY (user_id, symbol, timeframe)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_subscriptions_pair ON user_subscriptions (symbol, timeframe)')
+    if add_column_if_missing(conn, 'sent_news', 'sent_at', 'TEXT'):
+        cursor.execute('UPDATE sent_news SET sent_at = ? WHERE sent_at IS NULL', (datetime.datetime.now().isoformat(),))
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_sent_news_sent_at ON sent_news (sent_at)')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS signal_history (
+            id INTEGER PRIMARY KEY,
+            symbol TEXT NOT NULL,
+            timeframe TEXT NOT NULL,
+            signal TEXT NOT NULL,
+            recommendation TEXT,
+            entry_price REAL,
+            tp1 REAL,
+            tp2 REAL,
+            sl REAL,
+            recipients INTEGER,
+            ts TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_signal_history_pair_ts ON signal_history (symbol, timeframe, ts)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_signal_history_ts ON signal_history (ts)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS scan_leases (shard INTEGER PRIMARY KEY, owner TEXT, expires_at REAL NOT NULL DEFAULT 0)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS scan_workers (worker_id TEXT PRIMARY KEY, seen_at REAL NOT NULL)')
+    cursor.execute('CREATE TABLE IF NOT EXISTS scan_outbox (id INTEGER PRIMARY KEY, payload TEXT NOT NULL, created_at TEXT NOT NULL)')
+    migrate_subscriptions(conn)
+    migrate_bot_status(conn)
 
-def get_user_settings(user_id):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT subscribed_symbols, subscribed_timeframes FROM users WHERE user_id = ?', (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    if result and result[0] and result[1]:
-        return result[0].split(','), result[1].split(',')
+def add_column_if_missing(conn, table, column, definition):
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if column in columns:
+        return False
+    conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
+def split_csv(value):
+    return [item for item in value.split(',') if item] if value else []
+
+def migrate_subscriptions(conn):
+    # users.subscribed_symbols/subscribed_timeframes still record the menu selection; user_subscriptions
+    # holds the expanded (symbol, timeframe) pairs that signal fan-out reads.
+    if conn.execute('SELECT 1 FROM user_subscriptions LIMIT 1').fetchone():
+        return
+    rows = conn.execute('SELECT user_id, subscribed_symbols, subscribed_timeframes FROM users').fetchall()
+    conn.executemany(
+        'INSERT OR IGNORE INTO user_subscriptions (user_id, symbol, timeframe) VALUES (?, ?, ?)',
+        [(user_id, symbol, timeframe) for user_id, symbols, timeframes in rows for symbol in split_csv(symbols) for timeframe in split_csv(timeframes)],
+    )
+
+def migrate_bot_status(conn):
+    # bot_status used to gain a row per scan; collapse it into the single id = 1 row.
+    if 'id' in {row[1] for row in conn.execute('PRAGMA table_info(bot_status)')}:
+        return
+    last_signal_scan, last_news_scan = conn.execute('SELECT MAX(last_signal_scan), MAX(last_news_scan) FROM bot_status').fetchone()
+    conn.execute('DROP TABLE bot_status')
+    conn.execute('CREATE TABLE bot_status (id INTEGER PRIMARY KEY CHECK (id = 1), last_signal_scan TEXT, last_news_scan TEXT)')
+    conn.execute('INSERT INTO bot_status (id, last_signal_scan, last_news_scan) VALUES (1, ?, ?)', (last_signal_scan, last_news_scan))
+
+class SubscriptionIndex:
+    # Inverted index (symbol, timeframe) -> subscriber ids, kept in step with user_subscriptions.
+    def __init__(self):
+        self._subscribers = {}
+        self._pairs = {}
+
+    def load(self, rows):
+        self._subscribers.clear()
+        self._pairs.clear()
+        for user_id, symbol, timeframe in rows:
+            self._pairs.setdefault(user_id, set()).add((symbol, timeframe))
+            self._subscribers.setdefault((symbol, timeframe), set()).add(user_id)
+
+    def set_user(self, user_id, pairs):
+        for pair in self._pairs.pop(user_id, ()):
+            subscribers = self._subscribers.get(pair)
+            if subscribers is not None:
+                subscribers.discard(user_id)
+                if not subscribers:
+                    del self._subscribers[pair]
+        if pairs:
+            self._pairs[user_id] = set(pairs)
+            for pair in pairs:
+                self._subscribers.setdefault(pair, set()).add(user_id)
+
+    def subscribers(self, symbol, timeframe):
+        return self._subscribers.get((symbol, timeframe), frozenset())
+
+    def items(self):
+        return self._subscribers.items()
+
+SUBSCRIPTIONS = SubscriptionIndex()
+
+# --- User Profile Cache ---
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '600'))  # seconds
+
+class UserProfileCache:
+    # Bounded LRU of user rows with a TTL; the DB helpers below write through it.
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size or USER_CACHE_SIZE
+        self.ttl = ttl or USER_CACHE_TTL
+        self.hits = 0
+        self.misses = 0
+        self.lookups = 0
+        self.lookup_time = 0.0
+        self._profiles = OrderedDict()
+
+    def get(self, user_id):
+        entry = self._profiles.get(user_id)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            self._profiles.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._profiles[user_id]
+        self.misses += 1
+        return None
+
+    def put(self, user_id, profile):
+        self._profiles[user_id] = (time.monotonic(), profile)
+        self._profiles.move_to_end(user_id)
+        while len(self._profiles) > self.max_size:
+            self._profiles.popitem(last=False)
+
+    def update(self, user_id, **fields):
+        entry = self._profiles.get(user_id)
+        if entry is not None:
+            entry[1].update(fields)
+
+    def invalidate(self, user_id):
+        self._profiles.pop(user_id, None)
+
+    def record_lookup(self, elapsed):
+        self.lookups += 1
+        self.lookup_time += elapsed
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._profiles),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'avg_lookup_ms': self.lookup_time / self.lookups * 1000 if self.lookups else 0.0,
+        }
+
+USER_CACHE = UserProfileCache()
+
+def make_user_profile(row):
+    language, is_subscribed, expiry_date, symbols, timeframes = row
+    return {
+        'language': language,
+        'is_subscribed': bool(is_subscribed),
+        'expiry': datetime.datetime.fromisoformat(expiry_date) if expiry_date else None,
+        'symbols': split_csv(symbols),
+        'timeframes': split_csv(timeframes),
+    }
+
+async def get_user_profile(user_id):
+    started = time.perf_counter()
+    profile = USER_CACHE.get(user_id)
+    if profile is None:
+        row = await DB.fetchone('SELECT language, is_subscribed, subscription_expiry_date, subscribed_symbols, subscribed_timeframes FROM users WHERE user_id = ?', (user_id,))
+        if row:
+            profile = make_user_profile(row)
+            USER_CACHE.put(user_id, profile)
+    USER_CACHE.record_lookup(time.perf_counter() - started)
+    return profile
+
+def setup_database():
+    DB.call(create_schema)
+    SUBSCRIPTIONS.load(DB.call(lambda conn: conn.execute('SELECT user_id, symbol, timeframe FROM user_subscriptions').fetchall()))
+
+async def get_user_settings(user_id):
+    profile = await get_user_profile(user_id)
+    if profile:
+        return list(profile['symbols']), list(profile['timeframes'])
     return [], []
 
-def update_user_settings(user_id, symbols, timeframes):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+async def update_user_settings(user_id, symbols, timeframes):
     symbols_str = ','.join(symbols)
     timeframes_str = ','.join(timeframes)
-    cursor.execute('UPDATE users SET subscribed_symbols = ?, subscribed_timeframes = ? WHERE user_id = ?', (symbols_str, timeframes_str, user_id))
-    conn.commit()
-    conn.close()
+    pairs = [(symbol, timeframe) for symbol in symbols for timeframe in timeframes]
+    await DB.transaction(
+        [('UPDATE users SET subscribed_symbols = ?, subscribed_timeframes = ? WHERE user_id = ?', (symbols_str, timeframes_str, user_id)),
+         ('DELETE FROM user_subscriptions WHERE user_id = ?', (user_id,))]
+        + [('INSERT OR IGNORE INTO user_subscriptions (user_id, symbol, timeframe) VALUES (?, ?, ?)', (user_id, symbol, timeframe)) for symbol, timeframe in pairs]
+    )
+    SUBSCRIPTIONS.set_user(user_id, pairs)
+    USER_CACHE.update(user_id, symbols=list(symbols), timeframes=list(timeframes))
 
-def get_subscribed_users():
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+async def get_subscribed_users():
     current_time_iso = datetime.datetime.now().isoformat()
-    cursor.execute('SELECT user_id, language, subscribed_symbols, subscribed_timeframes FROM users WHERE is_subscribed = 1 AND subscription_expiry_date > ?', (current_time_iso,))
-    results = cursor.fetchall()
-    conn.close()
-    return results
+    return await DB.fetchall('SELECT user_id, language FROM users WHERE is_subscribed = 1 AND subscription_expiry_date > ?', (current_time_iso,))
 
-def is_user_subscribed(user_id):
+async def is_user_subscribed(user_id):
     if user_id == ADMIN_USER_ID:
         return True
 
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT subscription_expiry_date FROM users WHERE user_id = ?', (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    if result and result[0]:
-        expiry_date = datetime.datetime.fromisoformat(result[0])
-        return expiry_date > datetime.datetime.now()
+    profile = await get_user_profile(user_id)
+    if profile and profile['expiry']:
+        return profile['expiry'] > datetime.datetime.now()
     return False
 
-def add_user_if_not_exists(user_id):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('INSERT OR IGNORE INTO users (user_id) VALUES (?)', (user_id,))
-    conn.commit()
-    conn.close()
+async def add_user_if_not_exists(user_id):
+    if await get_user_profile(user_id) is None:
+        await DB.execute('INSERT OR IGNORE INTO users (user_id) VALUES (?)', (user_id,))
 
-def update_subscription_status(user_id, status, duration=None):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
+async def update_subscription_status(user_id, status, duration=None):
     expiry_date = None
     if status == 1 and duration:
         if duration == 'day':
@@ -130,74 +1451,282 @@ def update_subscription_status(user_id, status, duration=None):
             expiry_date = datetime.datetime.now() + datetime.timedelta(days=30)
     
     if expiry_date:
-        cursor.execute('UPDATE users SET is_subscribed = ?, subscription_expiry_date = ? WHERE user_id = ?', (status, expiry_date.isoformat(), user_id))
+        await DB.execute('UPDATE users SET is_subscribed = ?, subscription_expiry_date = ? WHERE user_id = ?', (status, expiry_date.isoformat(), user_id))
+        USER_CACHE.update(user_id, is_subscribed=bool(status), expiry=expiry_date)
     else:
-        cursor.execute('UPDATE users SET is_subscribed = ? WHERE user_id = ?', (status, user_id))
-    conn.commit()
-    conn.close()
+        await DB.execute('UPDATE users SET is_subscribed = ? WHERE user_id = ?', (status, user_id))
+        USER_CACHE.update(user_id, is_subscribed=bool(status))
 
-def get_user_language(user_id):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT language FROM users WHERE user_id = ?', (user_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result[0] if result and result[0] else None
+async def get_user_language(user_id):
+    profile = await get_user_profile(user_id)
+    return profile['language'] if profile and profile['language'] else None
 
-def set_user_language(user_id, lang_code):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('UPDATE users SET language = ? WHERE user_id = ?', (lang_code, user_id))
-    conn.commit()
-    conn.close()
+async def set_user_language(user_id, lang_code):
+    await DB.execute('UPDATE users SET language = ? WHERE user_id = ?', (lang_code, user_id))
+    USER_CACHE.update(user_id, language=lang_code)
 
-def get_last_sent_signal(symbol, timeframe):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT signal, timestamp FROM sent_signals WHERE symbol = ? AND timeframe = ?', (symbol, timeframe))
-    result = cursor.fetchone()
-    conn.close()
-    return result
+async def get_last_sent_signals():
+    rows = await DB.fetchall('SELECT symbol, timeframe, signal FROM sent_signals')
+    return {(symbol, timeframe): signal for symbol, timeframe, signal in rows}
 
-def save_sent_signal(symbol, timeframe, signal):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('INSERT OR REPLACE INTO sent_signals (symbol, timeframe, signal, timestamp) VALUES (?, ?, ?, ?)', (symbol, timeframe, signal, datetime.datetime.now().isoformat()))
-    conn.commit()
-    conn.close()
+async def save_signal_changes(changes, outbox=False):
+    # changes: (levels, recommendation, recipients) per pair whose signal flipped; one transaction per scan.
+    # Scan workers also queue the levels for the bot process in the same transaction.
+    if not changes:
+        return
+    now = datetime.datetime.now().isoformat()
+
+    def write(conn):
+        conn.executemany(
+            'INSERT OR REPLACE INTO sent_signals (symbol, timeframe, signal, timestamp) VALUES (?, ?, ?, ?)',
+            [(levels['symbol'], levels['timeframe'], levels['signal'], now) for levels, _, _ in changes],
+        )
+        conn.executemany(
+            'INSERT INTO signal_history (symbol, timeframe, signal, recommendation, entry_price, tp1, tp2, sl, recipients, ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [(levels['symbol'], levels['timeframe'], levels['signal'], recommendation, levels['entry_price'], levels['tp1'], levels['tp2'], levels['sl'], recipients, now)
+             for levels, recommendation, recipients in changes],
+        )
+        if outbox:
+            conn.executemany('INSERT INTO scan_outbox (payload, created_at) VALUES (?, ?)', [(json.dumps(levels), now) for levels, _, _ in changes])
+    await DB.run(write)
+
+async def reload_subscriptions():
+    SUBSCRIPTIONS.load(await DB.fetchall('SELECT user_id, symbol, timeframe FROM user_subscriptions'))
+
+async def get_signal_history(symbol, timeframe, limit=50):
+    return await DB.fetchall(
+        'SELECT signal, recommendation, entry_price, tp1, tp2, sl, recipients, ts FROM signal_history WHERE symbol = ? AND timeframe = ? ORDER BY ts DESC LIMIT ?',
+        (symbol, timeframe, limit),
+    )
+
+async def prune_signal_history(cutoff, batch_size=5000):
+    # Deleted in bounded batches so a large backlog never holds the write lock for long.
+    deleted = 0
+    while True:
+        count = await DB.execute(
+            'DELETE FROM signal_history WHERE id IN (SELECT id FROM signal_history WHERE ts < ? ORDER BY ts LIMIT ?)',
+            (cutoff.isoformat(), batch_size),
+        )
+        deleted += count
+        if count < batch_size:
+            return deleted
     
-def is_news_sent(link):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT link FROM sent_news WHERE link = ?', (link,))
-    result = cursor.fetchone()
-    conn.close()
-    return result is not None
+async def get_sent_news():
+    return await DB.fetchall('SELECT link, sent_at FROM sent_news')
 
-def save_news_sent(link):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('INSERT OR IGNORE INTO sent_news (link) VALUES (?)', (link,))
-    conn.commit()
-    conn.close()
+async def save_news_sent(links):
+    sent_at = datetime.datetime.now().isoformat()
+    await DB.executemany('INSERT OR IGNORE INTO sent_news (link, sent_at) VALUES (?, ?)', [(link, sent_at) for link in links])
 
-def get_bot_status():
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    cursor.execute('SELECT last_signal_scan, last_news_scan FROM bot_status ORDER BY last_signal_scan DESC LIMIT 1')
-    result = cursor.fetchone()
-    conn.close()
-    return result
+async def prune_sent_news(cutoff):
+    return await DB.execute('DELETE FROM sent_news WHERE sent_at < ?', (cutoff.isoformat(),))
 
-def update_bot_status(scan_type):
-    conn = sqlite3.connect(DATABASE_NAME)
-    cursor = conn.cursor()
-    if scan_type == 'signals':
-        cursor.execute('INSERT INTO bot_status (last_signal_scan) VALUES (?)', (datetime.datetime.now().isoformat(),))
-    elif scan_type == 'news':
-        cursor.execute('INSERT INTO bot_status (last_news_scan) VALUES (?)', (datetime.datetime.now().isoformat(),))
-    conn.commit()
-    conn.close()
+async def get_bot_status():
+    return await DB.fetchone('SELECT last_signal_scan, last_news_scan FROM bot_status WHERE id = 1')
+
+async def update_bot_status(scan_type):
+    column = {'signals': 'last_signal_scan', 'news': 'last_news_scan'}[scan_type]
+    await DB.execute(
+        f'INSERT INTO bot_status (id, {column}) VALUES (1, ?) ON CONFLICT (id) DO UPDATE SET {column} = excluded.{column}',
+        (datetime.datetime.now().isoformat(),),
+    )
+
+# --- Telegram Broadcasts ---
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '16'))
+# Telegram allows about 30 msg/s per bot; broadcasts stay below that so direct command replies keep headroom.
+BROADCAST_RATE_LIMIT = float(os.getenv('BROADCAST_RATE_LIMIT', '25'))
+PRIVATE_CHAT_INTERVAL = float(os.getenv('PRIVATE_CHAT_INTERVAL', '1.0'))  # seconds between messages to one user
+GROUP_CHAT_INTERVAL = float(os.getenv('GROUP_CHAT_INTERVAL', '3.0'))  # groups and channels: 20 msg/min
+BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', '3'))
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BROADCAST = 10
+
+class BroadcastReport:
+    def __init__(self, name, total):
+        self.name = name
+        self.total = total
+        self.sent = 0
+        self.failed = 0
+        self.blocked = 0
+        self.latencies = []
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+        self.done = asyncio.Event()
+        if total == 0:
+            self.done.set()
+
+    def record(self, outcome, latency=None):
+        setattr(self, outcome, getattr(self, outcome) + 1)
+        METRICS.inc('broadcast_messages', outcome=outcome)
+        if latency is not None:
+            self.latencies.append(latency)
+            METRICS.observe('broadcast_delivery_seconds', latency)
+        if self.sent + self.failed + self.blocked == self.total:
+            self.elapsed = time.perf_counter() - self.started
+            self.done.set()
+            if self.total > 1:
+                METRICS.observe('broadcast_duration_seconds', self.elapsed)
+                summary = self.summary()
+                BROADCAST_LOG.info("broadcast finished", extra=kv(
+                    name=self.name, total=self.total, sent=self.sent, failed=self.failed, blocked=self.blocked,
+                    seconds=self.elapsed, msg_per_s=summary['throughput'], p95_latency=summary['p95_latency'],
+                ))
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0
+        return {
+            'total': self.total,
+            'sent': self.sent,
+            'failed': self.failed,
+            'blocked': self.blocked,
+            'elapsed': self.elapsed,
+            'throughput': self.sent / self.elapsed if self.elapsed else 0.0,
+            'p95_latency': p95,
+        }
+
+    async def wait(self):
+        await self.done.wait()
+        return self.summary()
+
+def retry_after_seconds(error):
+    retry_after = error.retry_after
+    if isinstance(retry_after, datetime.timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+class BroadcastQueue:
+    # Priority queue drained by a pool of senders that share one global token bucket and keep a minimum
+    # gap per chat. Interactive messages use a lower priority number and overtake queued broadcasts.
+    # A message whose chat is not due yet is parked with a not-before time instead of holding a sender.
+    def __init__(self):
+        self.bot = None
+        self.blocked_chats = set()
+        self._queue = asyncio.PriorityQueue()
+        self._limiter = TokenBucket(BROADCAST_RATE_LIMIT)
+        self._sequence = itertools.count()
+        self._next_send = {}
+        self._pruned_at = time.monotonic()
+        self._paused_until = 0.0
+        self._delayed = []
+        self._delayed_changed = asyncio.Event()
+        self._workers = []
+
+    def start(self, bot):
+        self.bot = bot
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(BROADCAST_WORKERS)]
+        self._workers.append(asyncio.create_task(self._release_delayed()))
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def broadcast(self, messages, name='broadcast', priority=PRIORITY_BROADCAST):
+        # messages: iterable of (chat_id, text, send_message kwargs)
+        messages = [message for message in messages if message[0] not in self.blocked_chats]
+        report = BroadcastReport(name, len(messages))
+        enqueued_at = time.monotonic()
+        for chat_id, text, kwargs in messages:
+            self._queue.put_nowait((priority, next(self._sequence), chat_id, text, kwargs, report, enqueued_at, 0))
+        return report
+
+    def pending(self):
+        return self._queue.qsize() + len(self._delayed)
+
+    async def join(self):
+        while True:
+            await self._queue.join()
+            if not self._delayed:
+                return
+            await asyncio.sleep(max(0.0, self._delayed[0][0] - time.monotonic()))
+
+    async def send(self, chat_id, text, priority=PRIORITY_INTERACTIVE, **kwargs):
+        return await self.broadcast([(chat_id, text, kwargs)], name='direct', priority=priority).wait()
+
+    def _chat_interval(self, chat_id):
+        if isinstance(chat_id, str) or chat_id < 0:
+            return GROUP_CHAT_INTERVAL
+        return PRIVATE_CHAT_INTERVAL
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._deliver(job)
+            except Exception:
+                BROADCAST_LOG.exception("broadcast worker error")
+            finally:
+                self._queue.task_done()
+
+    def _defer(self, job, not_before):
+        heapq.heappush(self._delayed, (not_before, job[1], job))
+        self._delayed_changed.set()
+
+    async def _release_delayed(self):
+        # Puts parked messages back into the queue once their chat gap or a RetryAfter pause has passed.
+        while True:
+            if self._delayed and self._delayed[0][0] <= time.monotonic():
+                self._queue.put_nowait(heapq.heappop(self._delayed)[2])
+                continue
+            self._delayed_changed.clear()
+            timeout = self._delayed[0][0] - time.monotonic() if self._delayed else None
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._delayed_changed.wait(), timeout)
+
+    def _prune_next_send(self, now):
+        if now - self._pruned_at >= 60:
+            self._next_send = {chat_id: send_at for chat_id, send_at in self._next_send.items() if send_at > now}
+            self._pruned_at = now
+
+    async def _deliver(self, job):
+        priority, sequence, chat_id, text, kwargs, report, enqueued_at, attempt = job
+        now = time.monotonic()
+        not_before = max(self._next_send.get(chat_id, 0.0), self._paused_until)
+        if not_before > now:
+            self._defer(job, not_before)
+            return
+        self._next_send[chat_id] = now + self._chat_interval(chat_id)
+        self._prune_next_send(now)
+        await self._limiter.acquire()
+
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+            report.record('sent', time.monotonic() - enqueued_at)
+        except telegram.error.RetryAfter as e:
+            delay = retry_after_seconds(e)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            self._retry(priority, sequence, chat_id, text, kwargs, report, enqueued_at, attempt, e)
+        except telegram.error.Forbidden:
+            self._block(chat_id, report)
+        except telegram.error.BadRequest as e:
+            # BadRequest subclasses NetworkError but is permanent (bad markup, deleted chat): never retry it.
+            if "chat not found" in str(e).lower():
+                self._block(chat_id, report)
+                return
+            report.record('failed')
+            BROADCAST_LOG.warning("send rejected", extra=kv(chat_id=chat_id, error=e))
+        except (telegram.error.TimedOut, telegram.error.NetworkError) as e:
+            self._next_send[chat_id] = time.monotonic() + 2 ** attempt
+            self._retry(priority, sequence, chat_id, text, kwargs, report, enqueued_at, attempt, e)
+        except Exception as e:
+            report.record('failed')
+            BROADCAST_LOG.warning("send failed", extra=kv(chat_id=chat_id, error=e))
+
+    def _block(self, chat_id, report):
+        self.blocked_chats.add(chat_id)
+        report.record('blocked')
+        BROADCAST_LOG.info("chat blocked the bot, skipping it from now on", extra=kv(chat_id=chat_id))
+
+    def _retry(self, priority, sequence, chat_id, text, kwargs, report, enqueued_at, attempt, error):
+        if attempt + 1 >= BROADCAST_MAX_RETRIES:
+            report.record('failed')
+            BROADCAST_LOG.warning("send failed, giving up", extra=kv(chat_id=chat_id, attempts=attempt + 1, error=error))
+            return
+        self._queue.put_nowait((priority, sequence, chat_id, text, kwargs, report, enqueued_at, attempt + 1))
+
+BROADCASTER = BroadcastQueue()
 
 # --- Localization & UI ---
 MESSAGES = {
@@ -220,10 +1749,15 @@ MESSAGES = {
         'activate_success': "✅ تم تفعيل اشتراك المستخدم {user_id} لمدة {duration}.",
         'activate_usage': "الرجاء استخدام الأمر بالشكل الصحيح: /admin_activate [user_id] [day|week|month]",
         'menu_settings': "⚙️ الإعدادات",
+        'settings_menu': "⚙️ الإعدادات\n\nالعملات المختارة: {selected} من أصل {total}.\nللبحث عن عملة استخدم /symbols متبوعاً بأول حروفها.",
+        'symbols_usage': "الرجاء استخدام الأمر بالشكل الصحيح: /symbols [أول حروف الرمز]\nمثال: `/symbols BTC`",
+        'symbols_found': "نتائج البحث عن {prefix}: {shown} من أصل {total}. اضغط على العملة لإضافتها أو إزالتها.",
+        'symbols_not_found': "❌ لا توجد عملات تبدأ بـ {prefix}.",
         'back_to_menu': "العودة للقائمة الرئيسية",
         'analyze_usage': "الرجاء استخدام الأمر بالشكل الصحيح: /analyze [الرمز] [الفاصل الزمني]\nمثال: `/analyze BTCUSDT 4h`",
         'analyze_error': "حدث خطأ أثناء تحليل العملة. يرجى التحقق من الرمز أو الفاصل الزمني والمحاولة مرة أخرى.",
         'analyze_analyzing': "جاري تحليل العملة {symbol} على الفاصل الزمني {timeframe}...",
+        'rate_limited': "⏳ طلبات كثيرة في وقت قصير. يرجى الانتظار قليلاً ثم المحاولة مرة أخرى.",
         'contact_admin_button': "👤 تواصل مع الآدمن",
         'admin_contact_info': "للتواصل مع الآدمن، يرجى إرسال رسالة إلى:\n@{admin_username}\n\nيرجى إرسال إيصال الدفع ومعرف المستخدم الخاص بك لتفعيل اشتراكك.",
     },
@@ -246,10 +1780,15 @@ MESSAGES = {
         'activate_success': "✅ Subscription for user {user_id} has been activated for {duration}.",
         'activate_usage': "Please use the command correctly: /admin_activate [user_id] [day|week|month]",
         'menu_settings': "⚙️ Settings",
+        'settings_menu': "⚙️ Settings\n\nSelected pairs: {selected} of {total}.\nTo find a pair, use /symbols followed by its first letters.",
+        'symbols_usage': "Please use the command correctly: /symbols [Symbol prefix]\nExample: `/symbols BTC`",
+        'symbols_found': "Pairs starting with {prefix}: showing {shown} of {total}. Tap a pair to add or remove it.",
+        'symbols_not_found': "❌ No pairs start with {prefix}.",
         'back_to_menu': "Back to Main Menu",
         'analyze_usage': "Please use the command correctly: /analyze [Symbol] [Timeframe]\nExample: `/analyze BTCUSDT 4h`",
         'analyze_error': "An error occurred while analyzing the symbol. Please check the symbol or timeframe and try again.",
         'analyze_analyzing': "Analyzing symbol {symbol} on timeframe {timeframe}...",
+        'rate_limited': "⏳ Too many requests. Please wait a moment and try again.",
         'contact_admin_button': "👤 Contact Admin",
         'admin_contact_info': "To contact the admin, please send a message to:\n@{admin_username}\n\nPlease send your payment receipt and your User ID to activate your subscription.",
     }
@@ -259,68 +1798,206 @@ MESSAGES = {
 def get_messages(lang):
     return MESSAGES.get(lang, MESSAGES['ar'])
 
+# --- Signal Pipeline ---
+async def compute_signal_levels(symbol, timeframe, signal):
+    ticker = await TICKER_CACHE.get(symbol)
+    current_price = ticker['last']
+    
+    atr = await CANDLE_STORE.atr(symbol, timeframe)
+
+    if signal == "BUY":
+        entry_price = current_price
+        sl = current_price - (atr * 1.5)
+        tp1 = current_price + (atr * 1.0)
+        tp2 = current_price + (atr * 2.0)
+    else:
+        entry_price = current_price
+        sl = current_price + (atr * 1.5)
+        tp1 = current_price - (atr * 1.0)
+        tp2 = current_price - (atr * 2.0)
+
+    return {
+        'symbol': symbol,
+        'timeframe': timeframe,
+        'signal': signal,
+        'entry_price': round(entry_price, 4),
+        'tp1': round(tp1, 4),
+        'tp2': round(tp2, 4),
+        'sl': round(sl, 4),
+    }
+
+def render_signal(levels, lang):
+    return get_messages(lang)['signal_found'].format(**levels)
+
+def build_signal_messages(levels, recipients):
+    # recipients: {user_id: language}. Each language is rendered once and the text is shared by reference.
+    if CHANNEL_ID:
+        return [(CHANNEL_ID, render_signal(levels, CHANNEL_LANGUAGE), {'parse_mode': 'Markdown'})] if recipients else []
+    rendered = {}
+    messages = []
+    for user_id, lang in recipients.items():
+        if lang not in rendered:
+            rendered[lang] = render_signal(levels, lang)
+        messages.append((user_id, rendered[lang], {'parse_mode': 'Markdown'}))
+    return messages
+
+# --- Interactive Requests ---
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '64'))
+USER_MAX_IN_FLIGHT = int(os.getenv('USER_MAX_IN_FLIGHT', '2'))
+ANALYZE_COOLDOWN_SECONDS = float(os.getenv('ANALYZE_COOLDOWN_SECONDS', '10'))
+ANALYSIS_CACHE_SIZE = int(os.getenv('ANALYSIS_CACHE_SIZE', '1024'))
+
+def current_candle_open(timeframe):
+    step = TIMEFRAME_MS[timeframe]
+    return int(time.time() * 1000) // step * step
+
+async def analyze_symbol(symbol, timeframe):
+    recommendation = await fetch_recommendation(symbol, timeframe)
+    signal = recommendation_to_signal(recommendation)
+    if not signal:
+        return None
+    return await compute_signal_levels(symbol, timeframe, signal)
+
+class AnalysisCache:
+    # /analyze results keyed by (symbol, timeframe, candle): every request inside the same candle shares
+    # one computation, and requests arriving while it runs await the same task. Failures, including
+    # symbols without an analysis, are not cached: only a neutral (None) or a levels result is stored.
+    def __init__(self, max_size=None):
+        self.max_size = max_size or ANALYSIS_CACHE_SIZE
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+        self._results = OrderedDict()
+        self._inflight = {}
+
+    async def _compute(self, key):
+        levels = await analyze_symbol(key[0], key[1])
+        self._results[key] = levels
+        self._results.move_to_end(key)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last=False)
+        return levels
+
+    async def get(self, symbol, timeframe):
+        key = (symbol, timeframe, current_candle_open(timeframe))
+        if key in self._results:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return self._results[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._compute(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self):
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            'hits': self.hits,
+            'coalesced': self.coalesced,
+            'misses': self.misses,
+            'shared_ratio': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            'cached_results': len(self._results),
+        }
+
+ANALYSIS_CACHE = AnalysisCache()
+
+class UserThrottle:
+    # Admission control once updates are processed concurrently: caps the handlers a single user can
+    # have running, enforces per-command cooldowns and serializes read-modify-write settings updates.
+    def __init__(self, max_in_flight=None):
+        self.max_in_flight = max_in_flight or USER_MAX_IN_FLIGHT
+        self.rejected = 0
+        self._in_flight = {}
+        self._last_started = {}
+        self._locks = {}
+
+    def _prune(self, now, cooldown):
+        if len(self._last_started) > 10000:
+            self._last_started = {key: started for key, started in self._last_started.items() if now - started < cooldown}
+
+    async def _reject(self, update):
+        self.rejected += 1
+        translations = get_messages(await get_user_language(update.effective_user.id))
+        if update.callback_query:
+            await update.callback_query.answer(translations['rate_limited'])
+        elif update.effective_message:
+            await update.effective_message.reply_text(translations['rate_limited'])
+
+    def limit(self, handler, cooldown=0.0):
+        @functools.wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            if update.effective_user is None:
+                return await handler(update, context)
+            user_id = update.effective_user.id
+            key = (user_id, handler.__name__)
+            now = time.monotonic()
+            last_started = self._last_started.get(key)
+            if self._in_flight.get(user_id, 0) >= self.max_in_flight or (last_started is not None and now - last_started < cooldown):
+                await self._reject(update)
+                return
+            if cooldown:
+                self._last_started[key] = now
+                self._prune(now, cooldown)
+            self._in_flight[user_id] = self._in_flight.get(user_id, 0) + 1
+            try:
+                return await handler(update, context)
+            finally:
+                self._in_flight[user_id] -= 1
+                if not self._in_flight[user_id]:
+                    del self._in_flight[user_id]
+        return wrapper
+
+    def serialize(self, handler):
+        @functools.wraps(handler)
+        async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+            if update.effective_user is None:
+                return await handler(update, context)
+            user_id = update.effective_user.id
+            entry = self._locks.setdefault(user_id, [asyncio.Lock(), 0])
+            entry[1] += 1
+            try:
+                async with entry[0]:
+                    return await handler(update, context)
+            finally:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[user_id]
+        return wrapper
+
+USER_THROTTLE = UserThrottle()
+
+def timed_handler(handler):
+    @functools.wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
+        with METRICS.timer('handler_seconds', handler=handler.__name__):
+            return await handler(update, context)
+    return wrapper
+
 async def analyze_and_send_signal(context: ContextTypes.DEFAULT_TYPE, user_id: int, symbol: str, timeframe_str: str, lang: str):
     translations = get_messages(lang)
     
     try:
-        handler = TA_Handler(
-            symbol=symbol,
-            screener="crypto",
-            exchange="BINANCE",
-            interval=TIMEFRAMES_ENUM[timeframe_str],
-        )
-        analysis = handler.get_analysis()
+        levels = await ANALYSIS_CACHE.get(symbol, timeframe_str)
         
-        if analysis and analysis.summary:
-            recommendation = analysis.summary['RECOMMENDATION']
-            signal = None
-            if recommendation in ['STRONG_BUY', 'BUY']:
-                signal = "BUY"
-            elif recommendation in ['STRONG_SELL', 'SELL']:
-                signal = "SELL"
-            
-            if signal:
-                exchange = ccxt.binance()
-                ticker = exchange.fetch_ticker(symbol)
-                current_price = ticker['last']
-                
-                ohlcv = exchange.fetch_ohlcv(symbol, timeframe_str, limit=14)
-                df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-                atr = talib.ATR(df['high'], df['low'], df['close'], timeperiod=14).iloc[-1]
-
-                if signal == "BUY":
-                    entry_price = current_price
-                    sl = current_price - (atr * 1.5)
-                    tp1 = current_price + (atr * 1.0)
-                    tp2 = current_price + (atr * 2.0)
-                else:
-                    entry_price = current_price
-                    sl = current_price + (atr * 1.5)
-                    tp1 = current_price - (atr * 1.0)
-                    tp2 = current_price - (atr * 2.0)
-                
-                message = translations['signal_found'].format(
-                    symbol=symbol,
-                    timeframe=timeframe_str,
-                    signal=signal,
-                    entry_price=round(entry_price, 4),
-                    tp1=round(tp1, 4),
-                    tp2=round(tp2, 4),
-                    sl=round(sl, 4)
-                )
-                if CHANNEL_ID:
-                    await context.bot.send_message(chat_id=CHANNEL_ID, text=message, parse_mode='Markdown')
-                else:
-                    await context.bot.send_message(chat_id=user_id, text=message, parse_mode='Markdown')
-                print(f"Alert sent to user {user_id} for {symbol} on {timeframe_str} - {signal}")
+        if levels:
+            message = render_signal(levels, lang)
+            await BROADCASTER.send(CHANNEL_ID or user_id, message, parse_mode='Markdown')
+            HANDLER_LOG.debug("analysis sent", extra=kv(user_id=user_id, symbol=symbol, timeframe=timeframe_str, signal=levels['signal']))
     except Exception as e:
-        print(f"Error fetching signal for {symbol} on {timeframe_str}: {e}")
+        HANDLER_LOG.warning("analysis failed", extra=kv(user_id=user_id, symbol=symbol, timeframe=timeframe_str, error=e))
         await context.bot.send_message(chat_id=user_id, text=translations['analyze_error'], parse_mode='Markdown')
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    add_user_if_not_exists(user_id)
-    user_lang = get_user_language(user_id)
+    BROADCASTER.blocked_chats.discard(user_id)
+    await add_user_if_not_exists(user_id)
+    user_lang = await get_user_language(user_id)
     
     if not user_lang:
         keyboard = [
@@ -332,7 +2009,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     else:
         translations = get_messages(user_lang)
         
-        if is_user_subscribed(user_id):
+        if await is_user_subscribed(user_id):
             await update.message.reply_text(translations['welcome_subscribed'], parse_mode='Markdown')
             await menu_command(update, context)
         else:
@@ -343,20 +2020,20 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def myid_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    lang = get_user_language(user_id)
+    lang = await get_user_language(user_id)
     translations = get_messages(lang)
     await update.message.reply_text(translations['myid'].format(user_id=user_id), parse_mode='Markdown')
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    lang = get_user_language(user_id)
+    lang = await get_user_language(user_id)
     translations = get_messages(lang)
 
-    if not is_user_subscribed(user_id):
+    if not await is_user_subscribed(user_id):
         await update.message.reply_text(translations['main_menu_unsubscribed'])
         return
 
-    status_data = get_bot_status()
+    status_data = await get_bot_status()
     if status_data:
         last_signal = status_data[0] if status_data[0] else 'N/A'
         last_news = status_data[1] if status_data[1] else 'N/A'
@@ -367,22 +2044,21 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
 async def info_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    lang = get_user_language(user_id)
+    lang = await get_user_language(user_id)
     translations = get_messages(lang)
 
-    if not is_user_subscribed(user_id):
+    if not await is_user_subscribed(user_id):
         await update.message.reply_text(translations['main_menu_unsubscribed'])
         return
 
     try:
         symbol = context.args[0].upper()
-        exchange = ccxt.binance()
-        ticker = exchange.fetch_ticker(symbol)
+        ticker = await TICKER_CACHE.get(symbol)
 
         price = round(ticker['last'], 4)
-        change_percent = round(ticker['change_24h'], 2)
-        high = round(ticker['high_24h'], 4)
-        low = round(ticker['low_24h'], 4)
+        change_percent = round(ticker['percentage'], 2)
+        high = round(ticker['high'], 4)
+        low = round(ticker['low'], 4)
         volume = round(ticker['quoteVolume'], 2)
         
         message = translations['info_details'].format(
@@ -394,14 +2070,14 @@ async def info_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             volume=volume
         )
         await update.message.reply_text(message, parse_mode='Markdown')
-    except (IndexError, ccxt.ExchangeError):
+    except (IndexError, ccxt_async.ExchangeError):
         await update.message.reply_text(translations['info_not_found'].format(symbol=context.args[0].upper()))
     except Exception as e:
         await update.message.reply_text(translations['analyze_error'])
 
 async def admin_activate(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    lang = get_user_language(user_id)
+    lang = await get_user_language(user_id)
     translations = get_messages(lang)
     
     if user_id != ADMIN_USER_ID:
@@ -415,17 +2091,48 @@ async def admin_activate(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(translations['activate_usage'])
             return
             
-        update_subscription_status(user_to_activate, 1, duration)
+        await update_subscription_status(user_to_activate, 1, duration)
         await update.message.reply_text(translations['activate_success'].format(user_id=user_to_activate, duration=duration))
     except (IndexError, ValueError):
         await update.message.reply_text(translations['activate_usage'])
 
+async def symbols_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    lang = await get_user_language(user_id)
+    translations = get_messages(lang)
+
+    if not await is_user_subscribed(user_id):
+        await update.message.reply_text(translations['main_menu_unsubscribed'])
+        return
+
+    prefix = normalize_symbol_query(''.join(context.args or []))
+    if not prefix:
+        await update.message.reply_text(translations['symbols_usage'], parse_mode='Markdown')
+        return
+    text, reply_markup = await render_symbol_search(user_id, prefix, translations)
+    await update.message.reply_text(text, reply_markup=reply_markup)
+
+async def inline_query_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # Inline mode must be enabled with BotFather; an empty query lists the pinned pairs first.
+    prefix = normalize_symbol_query(update.inline_query.query)
+    symbols = SYMBOL_UNIVERSE.search(prefix, SYMBOL_SEARCH_LIMIT)[0] if prefix else SYMBOL_UNIVERSE.menu_order[:SYMBOL_SEARCH_LIMIT]
+    results = [
+        InlineQueryResultArticle(
+            id=symbol,
+            title=symbol,
+            description=SYMBOL_UNIVERSE.unified(symbol) or symbol,
+            input_message_content=InputTextMessageContent(f"/info {symbol}"),
+        )
+        for symbol in symbols
+    ]
+    await update.inline_query.answer(results, cache_time=INLINE_CACHE_SECONDS)
+
 async def analyze_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    lang = get_user_language(user_id)
+    lang = await get_user_language(user_id)
     translations = get_messages(lang)
 
-    if not is_user_subscribed(user_id):
+    if not await is_user_subscribed(user_id):
         await update.message.reply_text(translations['main_menu_unsubscribed'])
         return
     
@@ -443,7 +2150,7 @@ async def analyze_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def menu_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
-    lang = get_user_language(user_id)
+    lang = await get_user_language(user_id)
     translations = get_messages(lang)
     
     keyboard = [
@@ -461,11 +2168,11 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     if query.data.startswith('set_lang_'):
         lang_code = query.data.split('_')[2]
-        set_user_language(user_id, lang_code)
+        await set_user_language(user_id, lang_code)
         
         translations = get_messages(lang_code)
         
-        if is_user_subscribed(user_id):
+        if await is_user_subscribed(user_id):
             await query.message.reply_text(translations['welcome_subscribed'], parse_mode='Markdown')
             await menu_command(update, context)
         else:
@@ -475,7 +2182,7 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await query.message.reply_text(translations['main_menu_unsubscribed'], reply_markup=reply_markup)
         return
     
-    lang = get_user_language(user_id)
+    lang = await get_user_language(user_id)
     translations = get_messages(lang)
 
     if query.data == 'contact_admin':
@@ -490,223 +2197,900 @@ async def callback_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await menu_command(update, context)
         return
 
-    if not is_user_subscribed(user_id):
+    if not await is_user_subscribed(user_id):
         keyboard = [[InlineKeyboardButton(translations['subscription_button'], callback_data='show_subscription_info')]]
         reply_markup = InlineKeyboardMarkup(keyboard)
         await query.message.reply_text(translations['main_menu_unsubscribed'], reply_markup=reply_markup)
         return
 
-    if query.data == 'settings':
-        await show_settings_menu(query, translations)
-    elif query.data.startswith('toggle_symbol_'):
-        await toggle_symbol(query, translations, show_settings_menu)
-    elif query.data.startswith('toggle_timeframe_'):
-        await toggle_timeframe(query, translations, show_settings_menu)
+    action, view, value = parse_settings_callback(query.data)
+    if action == 'ss' or action == 'sf':
+        await toggle_symbol(user_id, value)
+    elif action == 'st':
+        await toggle_timeframe(user_id, value)
 
-async def show_settings_menu(query, translations):
-    user_id = query.from_user.id
-    subscribed_symbols, subscribed_timeframes = get_user_settings(user_id)
-    all_symbols = ["BTCUSDT", "ETHUSDT", "SOLUSDT", "ADAUSDT", "XRPUSDT"]
-    all_timeframes = ["15m", "1h", "4h"]
-    
-    keyboard = []
-    for symbol in all_symbols:
-        emoji = "✅" if symbol in subscribed_symbols else "◻️"
-        keyboard.append([InlineKeyboardButton(f"{emoji} {symbol}", callback_data=f'toggle_symbol_{symbol}')])
-    
-    keyboard.append([InlineKeyboardButton("---", callback_data='_ignore_')])
-    
-    for timeframe in all_timeframes:
-        emoji = "✅" if timeframe in subscribed_timeframes else "◻️"
-        keyboard.append([InlineKeyboardButton(f"{emoji} {timeframe}", callback_data=f'toggle_timeframe_{timeframe}')])
-    
+    if action in ('sp', 'ss', 'st') and view.isdigit():
+        await show_settings_menu(query, translations, int(view))
+    elif action == 'sf':
+        text, reply_markup = await render_symbol_search(user_id, view, translations)
+        await edit_menu(query, text, reply_markup)
+
+def parse_settings_callback(data):
+    # Callback data is capped at 64 bytes, so settings buttons use 'sp:<page>', 'ss:<page>:<symbol>',
+    # 'st:<page>:<timeframe>' and 'sf:<prefix>:<symbol>'. Buttons from before pagination open page 0.
+    if data == 'settings':
+        return 'sp', '0', None
+    if data.startswith('toggle_symbol_'):
+        return 'ss', '0', data[len('toggle_symbol_'):]
+    if data.startswith('toggle_timeframe_'):
+        return 'st', '0', data[len('toggle_timeframe_'):]
+    action, _, rest = data.partition(':')
+    view, _, value = rest.partition(':')
+    return action, view, value
+
+def toggle_button(label, selected, callback_data):
+    return InlineKeyboardButton(f"{'✅' if selected else '◻️'} {label}", callback_data=callback_data)
+
+def button_rows(buttons, width=2):
+    return [buttons[i:i + width] for i in range(0, len(buttons), width)]
+
+def settings_keyboard(page, subscribed_symbols, subscribed_timeframes, translations):
+    symbols, page, pages = SYMBOL_UNIVERSE.page(page)
+    subscribed_symbols = set(subscribed_symbols)
+    keyboard = button_rows([toggle_button(symbol, symbol in subscribed_symbols, f'ss:{page}:{symbol}') for symbol in symbols])
+    keyboard.append([
+        InlineKeyboardButton("◀️", callback_data=f'sp:{(page - 1) % pages}'),
+        InlineKeyboardButton(f"{page + 1}/{pages}", callback_data='_ignore_'),
+        InlineKeyboardButton("▶️", callback_data=f'sp:{(page + 1) % pages}'),
+    ])
+    keyboard.append([toggle_button(timeframe, timeframe in subscribed_timeframes, f'st:{page}:{timeframe}') for timeframe in TIMEFRAMES_ENUM])
     keyboard.append([InlineKeyboardButton(translations['back_to_menu'], callback_data='back_to_menu')])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
+    return InlineKeyboardMarkup(keyboard)
+
+async def edit_menu(query, text, reply_markup):
     try:
-        await query.edit_message_text(translations['menu_settings'], reply_markup=reply_markup)
+        await query.edit_message_text(text, reply_markup=reply_markup)
     except telegram.error.BadRequest as e:
         if "Message is not modified" not in str(e):
             raise e
 
-async def toggle_symbol(query, translations, next_func):
+async def show_settings_menu(query, translations, page=0):
     user_id = query.from_user.id
-    symbol = query.data.split('_')[2]
-    subscribed_symbols, subscribed_timeframes = get_user_settings(user_id)
+    subscribed_symbols, subscribed_timeframes = await get_user_settings(user_id)
+    text = translations['settings_menu'].format(selected=len(subscribed_symbols), total=len(SYMBOL_UNIVERSE))
+    await edit_menu(query, text, settings_keyboard(page, subscribed_symbols, subscribed_timeframes, translations))
+
+async def render_symbol_search(user_id, prefix, translations):
+    matches, total = SYMBOL_UNIVERSE.search(prefix, SYMBOL_SEARCH_LIMIT)
+    if not matches:
+        return translations['symbols_not_found'].format(prefix=prefix), None
+    subscribed_symbols, _ = await get_user_settings(user_id)
+    keyboard = button_rows([toggle_button(symbol, symbol in subscribed_symbols, f'sf:{prefix}:{symbol}') for symbol in matches])
+    keyboard.append([InlineKeyboardButton(translations['menu_settings'], callback_data='sp:0')])
+    return translations['symbols_found'].format(prefix=prefix, shown=len(matches), total=total), InlineKeyboardMarkup(keyboard)
+
+async def toggle_symbol(user_id, symbol):
+    subscribed_symbols, subscribed_timeframes = await get_user_settings(user_id)
     
     if symbol in subscribed_symbols:
         subscribed_symbols.remove(symbol)
-    else:
+    elif SYMBOL_UNIVERSE.is_tradable(symbol):
         subscribed_symbols.append(symbol)
+    else:
+        return
     
-    update_user_settings(user_id, subscribed_symbols, subscribed_timeframes)
-    await next_func(query, translations)
+    await update_user_settings(user_id, subscribed_symbols, subscribed_timeframes)
+    SCAN_SCHEDULER.sync()
 
-async def toggle_timeframe(query, translations, next_func):
-    user_id = query.from_user.id
-    timeframe = query.data.split('_')[2]
-    subscribed_symbols, subscribed_timeframes = get_user_settings(user_id)
+async def toggle_timeframe(user_id, timeframe):
+    subscribed_symbols, subscribed_timeframes = await get_user_settings(user_id)
     
     if timeframe in subscribed_timeframes:
         subscribed_timeframes.remove(timeframe)
-    else:
+    elif timeframe in TIMEFRAMES_ENUM:
         subscribed_timeframes.append(timeframe)
+    else:
+        return
     
-    update_user_settings(user_id, subscribed_symbols, subscribed_timeframes)
-    await next_func(query, translations)
+    await update_user_settings(user_id, subscribed_symbols, subscribed_timeframes)
+    SCAN_SCHEDULER.sync()
 
 TIMEFRAMES_ENUM = {
-    "15m": Interval.INTERVAL_15_MINUTES,
-    "1h": Interval.INTERVAL_1_HOUR,
-    "4h": Interval.INTERVAL_4_HOURS,
-    "1d": Interval.INTERVAL_1_DAY,
+    # Values are tradingview_ta Interval constants, spelled out so the library is not imported at startup.
+    "15m": "15m",
+    "1h": "1h",
+    "4h": "4h",
+    "1d": "1d",
 }
 
-async def send_alert(context: ContextTypes.DEFAULT_TYPE, user_id: int, symbol: str, timeframe: str, signal: str, lang: str):
-    translations = get_messages(lang)
-    
-    try:
-        exchange = ccxt.binance()
-        ticker = exchange.fetch_ticker(symbol)
-        current_price = ticker['last']
-        
-        ohlcv = exchange.fetch_ohlcv(symbol, timeframe, limit=14)
-        df = pd.DataFrame(ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        atr = talib.ATR(df['high'], df['low'], df['close'], timeperiod=14).iloc[-1]
-
-        if signal == "BUY":
-            entry_price = current_price
-            sl = current_price - (atr * 1.5)
-            tp1 = current_price + (atr * 1.0)
-            tp2 = current_price + (atr * 2.0)
-        else:
-            entry_price = current_price
-            sl = current_price + (atr * 1.5)
-            tp1 = current_price - (atr * 1.0)
-            tp2 = current_price - (atr * 2.0)
+def get_monitored_pairs(subscribed_users):
+    return sorted(
+        (pair for pair, user_ids in SUBSCRIPTIONS.items()
+         if pair[1] in TIMEFRAMES_ENUM and SYMBOL_UNIVERSE.is_tradable(pair[0]) and not user_ids.isdisjoint(subscribed_users)),
+        key=lambda pair: (pair[1], pair[0]),
+    )
 
-        message = translations['signal_found'].format(
-            symbol=symbol,
-            timeframe=timeframe,
-            signal=signal,
-            entry_price=round(entry_price, 4),
-            tp1=round(tp1, 4),
-            tp2=round(tp2, 4),
-            sl=round(sl, 4)
-        )
-        if CHANNEL_ID:
-            await context.bot.send_message(chat_id=CHANNEL_ID, text=message, parse_mode='Markdown')
-        else:
-            await context.bot.send_message(chat_id=user_id, text=message, parse_mode='Markdown')
-        print(f"Alert sent to user {user_id} for {symbol} on {timeframe} - {signal}")
-    except Exception as e:
-        print(f"Failed to send alert with TP/SL to user {user_id}: {e}")
-    
-    
 async def monitor_tradingview_signals(context: ContextTypes.DEFAULT_TYPE):
-    print("Running autonomous market scan...")
-    update_bot_status('signals')
-    subscribed_users = get_subscribed_users()
-    print(f"Found {len(subscribed_users)} subscribed users to monitor.")
-    
-    all_symbols_to_monitor = set()
-    all_timeframes_to_monitor = set()
+    await run_signal_scan()
+
+async def run_signal_scan(only_pairs=None, timeframes=None):
+    await update_bot_status('signals')
+    subscribed_users = dict(await get_subscribed_users())
     
-    for _, _, symbols_str, timeframes_str in subscribed_users:
-        if symbols_str:
-            for s in symbols_str.split(','):
-                all_symbols_to_monitor.add(s)
-        if timeframes_str:
-            for t in timeframes_str.split(','):
-                all_timeframes_to_monitor.add(t)
-
-    print(f"Monitoring symbols: {all_symbols_to_monitor}")
-    print(f"Monitoring timeframes: {all_timeframes_to_monitor}")
-
-    for symbol in all_symbols_to_monitor:
-        for timeframe_str in all_timeframes_to_monitor:
-            try:
-                time.sleep(1) 
-                
-                handler = TA_Handler(
-                    symbol=symbol,
-                    screener="crypto",
-                    exchange="BINANCE",
-                    interval=TIMEFRAMES_ENUM[timeframe_str],
+    pairs = get_monitored_pairs(subscribed_users)
+    if only_pairs is not None:
+        pairs = [pair for pair in pairs if pair in only_pairs]
+    if timeframes is not None:
+        pairs = [pair for pair in pairs if pair[1] in timeframes]
+    all_symbols_to_monitor = {symbol for symbol, _ in pairs}
+
+    if only_pairs is None:
+        TICKER_CACHE.set_monitored(all_symbols_to_monitor)
+    else:
+        TICKER_CACHE.monitored.update(all_symbols_to_monitor)
+
+    scan_started = time.perf_counter()
+    recommendations, errors, analysis_time = await scan_recommendations(pairs)
+    last_signals = await get_last_sent_signals()
+    changes = []
+    outcomes = {'no_signal': 0, 'unchanged': 0, 'alerted': 0, 'failed': len(errors)}
+
+    flipped = {}
+    for symbol, timeframe_str in pairs:
+        if (symbol, timeframe_str) in errors:
+            SCAN_LOG.debug("signal fetch failed", extra=kv(symbol=symbol, timeframe=timeframe_str, error=errors[(symbol, timeframe_str)]))
+            continue
+        recommendation = recommendations.get((symbol, timeframe_str))
+        signal = recommendation_to_signal(recommendation) if recommendation else None
+        SCAN_LOG.debug("pair scanned", extra=kv(symbol=symbol, timeframe=timeframe_str, recommendation=recommendation))
+        if not signal:
+            outcomes['no_signal'] += 1
+        elif last_signals.get((symbol, timeframe_str)) != signal:
+            flipped[(symbol, timeframe_str, signal)] = recommendation
+        else:
+            outcomes['unchanged'] += 1
+
+    # Each alert needs a ticker and an ATR from Binance; fetch them concurrently, paced by the binance bucket.
+    levels_results, _ = await run_concurrently(list(flipped), compute_signal_levels)
+    for (symbol, timeframe_str, signal), levels, error in levels_results:
+        if error:
+            outcomes['failed'] += 1
+            SCAN_LOG.warning("signal processing failed", extra=kv(symbol=symbol, timeframe=timeframe_str, error=error))
+            continue
+        recipients = {user_id: subscribed_users[user_id] for user_id in SUBSCRIPTIONS.subscribers(symbol, timeframe_str) if user_id in subscribed_users}
+        if not WORKER_MODE:
+            BROADCASTER.broadcast(build_signal_messages(levels, recipients), name=f"{symbol} {timeframe_str} {signal}")
+        METRICS.inc('signals_sent', timeframe=timeframe_str, signal=signal)
+        changes.append((levels, flipped[(symbol, timeframe_str, signal)], len(recipients)))
+        outcomes['alerted'] += 1
+
+    await save_signal_changes(changes, outbox=WORKER_MODE)
+    if errors:
+        SCAN_LOG.warning("signal fetch failed", extra=kv(pairs=len(errors), example=next(iter(errors.values()))))
+    scan_time = time.perf_counter() - scan_started
+    METRICS.observe('scan_duration_seconds', scan_time)
+    METRICS.observe('scan_analysis_seconds', analysis_time)
+    METRICS.inc('scan_pairs', len(pairs))
+    METRICS.inc('scan_errors', len(errors))
+    SCAN_LOG.info("scan finished", extra=kv(
+        users=len(subscribed_users), symbols=len(all_symbols_to_monitor), pairs=len(pairs),
+        timeframes=','.join(sorted({timeframe for _, timeframe in pairs})), seconds=scan_time, analysis_seconds=analysis_time, **outcomes,
+    ))
+    return len(pairs)
+
+async def compact_database(context: ContextTypes.DEFAULT_TYPE):
+    cutoff = datetime.datetime.now() - datetime.timedelta(days=SIGNAL_HISTORY_RETENTION_DAYS)
+    deleted = await prune_signal_history(cutoff)
+    # Freed pages are reused by later inserts; checkpointing keeps the WAL file from growing with them.
+    await DB.run(lambda conn: conn.execute('PRAGMA optimize'))
+    await DB.run(lambda conn: conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone())
+    SCAN_LOG.info("database compacted", extra=kv(signal_history_deleted=deleted, retention_days=SIGNAL_HISTORY_RETENTION_DAYS))
+
+# --- Scan Scheduler ---
+SCAN_SETTLE_DELAY = float(os.getenv('SCAN_SETTLE_DELAY', '10'))  # seconds to wait after a candle closes
+LEGACY_SCAN_INTERVAL = 300
+
+def seconds_until_close(timeframe, now=None):
+    period = TIMEFRAME_MS[timeframe] / 1000
+    now = now if now is not None else time.time()
+    return period - (now % period)
+
+def scan_request_count(pairs):
+    # Upstream calls behind one single-timeframe scan: TradingView batches the symbols, while the
+    # local engine updates candles pair by pair.
+    if SIGNAL_ENGINE == 'local':
+        return pairs
+    return -(-pairs // TRADINGVIEW_BATCH_SIZE)
+
+class ScanScheduler:
+    # One repeating job per subscribed timeframe, fired just after each candle close (UTC-aligned, like Binance).
+    def __init__(self):
+        self.job_queue = None
+        self.scans = {}
+        self.requests = 0
+        self.legacy_requests_equivalent = 0.0
+
+    def attach(self, job_queue):
+        self.job_queue = job_queue
+        self.sync()
+
+    def active_timeframes(self):
+        return {timeframe for (_, timeframe), user_ids in SUBSCRIPTIONS.items() if user_ids and timeframe in TIMEFRAMES_ENUM}
+
+    def sync(self):
+        if self.job_queue is None:
+            return
+        wanted = self.active_timeframes()
+        for timeframe in TIMEFRAMES_ENUM:
+            name = f"scan_{timeframe}"
+            jobs = self.job_queue.get_jobs_by_name(name)
+            if timeframe in wanted and not jobs:
+                self.job_queue.run_repeating(
+                    self._run,
+                    interval=TIMEFRAME_MS[timeframe] / 1000,
+                    first=seconds_until_close(timeframe) + SCAN_SETTLE_DELAY,
+                    name=name,
+                    data=timeframe,
                 )
-                analysis = handler.get_analysis()
-                
-                if analysis and analysis.summary:
-                    recommendation = analysis.summary['RECOMMENDATION']
-                    
-                    if recommendation in ['STRONG_BUY', 'BUY', 'STRONG_SELL', 'SELL']:
-                        print(f"Signal found for {symbol} on {timeframe_str}: {recommendation}")
-                        signal = "BUY" if "BUY" in recommendation else "SELL"
-                        
-                        last_signal = get_last_sent_signal(symbol, timeframe_str)
-                        
-                        if not last_signal or last_signal[0] != signal:
-                            for user_id, lang, user_symbols, user_timeframes in subscribed_users:
-                                if user_symbols and user_timeframes and symbol in user_symbols.split(',') and timeframe_str in user_timeframes.split(','):
-                                    await send_alert(context, user_id, symbol, timeframe_str, signal, lang)
-                            save_sent_signal(symbol, timeframe_str, signal)
-                    else:
-                        print(f"No strong signal for {symbol} on {timeframe_str}: {recommendation}")
+                SCAN_LOG.info("scheduled scans on candle close", extra=kv(timeframe=timeframe))
+            elif timeframe not in wanted:
+                for job in jobs:
+                    job.schedule_removal()
+                    SCAN_LOG.info("removed scans, no subscribers left", extra=kv(timeframe=timeframe))
+
+    async def _run(self, context: ContextTypes.DEFAULT_TYPE):
+        timeframe = context.job.data
+        scanned = await run_signal_scan(timeframes={timeframe})
+        self.scans[timeframe] = self.scans.get(timeframe, 0) + 1
+        requests = scan_request_count(scanned)
+        self.requests += requests
+        # A fixed 300 s job would have sent the same requests this many times during one candle.
+        self.legacy_requests_equivalent += requests * TIMEFRAME_MS[timeframe] / 1000 / LEGACY_SCAN_INTERVAL
+
+    def stats(self):
+        saved = self.legacy_requests_equivalent - self.requests
+        return {
+            'scans': dict(self.scans),
+            'upstream_requests': self.requests,
+            'fixed_interval_requests': round(self.legacy_requests_equivalent),
+            'requests_saved': round(saved),
+            'saved_ratio': saved / self.legacy_requests_equivalent if self.legacy_requests_equivalent else 0.0,
+        }
+
+SCAN_SCHEDULER = ScanScheduler()
+
+# --- Kline Streaming ---
+SCAN_MODE = os.getenv('SCAN_MODE', 'polling')  # 'polling' or 'streaming'
+BINANCE_STREAM_URL = os.getenv('BINANCE_STREAM_URL', 'wss://stream.binance.com:9443/stream')
+KLINE_REPLAY_FILE = os.getenv('KLINE_REPLAY_FILE')  # recorded feed (one stream message per line) to replay
+KLINE_RECORD_FILE = os.getenv('KLINE_RECORD_FILE')  # append live stream messages here for later replay
+STREAM_SETTLE_DELAY = float(os.getenv('STREAM_SETTLE_DELAY', '0.5'))  # seconds to gather closes of the same bar
+STREAM_RESUBSCRIBE_INTERVAL = float(os.getenv('STREAM_RESUBSCRIBE_INTERVAL', '60'))
+STREAMS_PER_CONNECTION = 200
+
+class KlineStream:
+    # Keeps the candle store current from exchange kline streams and scans a pair only when its bar closes.
+    def __init__(self):
+        self.messages = 0
+        self.closes = 0
+        self._pending = set()
+        self._flush_task = None
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        for task in (self._task, self._flush_task):
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*(task for task in (self._task, self._flush_task) if task is not None), return_exceptions=True)
+
+    async def wanted_pairs(self):
+        return frozenset(get_monitored_pairs(dict(await get_subscribed_users())))
+
+    async def run(self):
+        if KLINE_REPLAY_FILE:
+            await self.replay(KLINE_REPLAY_FILE)
+            return
+        while True:
+            pairs = await self.wanted_pairs()
+            if not pairs:
+                await asyncio.sleep(STREAM_RESUBSCRIBE_INTERVAL)
+                continue
+            try:
+                await self.consume(pairs)
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
-                print(f"Error fetching signal for {symbol} on {timeframe_str}: {e}")
+                STREAM_LOG.warning("kline stream error, reconnecting", extra=kv(error=e))
+                await asyncio.sleep(5)
+
+    async def consume(self, pairs):
+        # Returns when the subscribed pairs change or any connection drops, so run() reconnects.
+        # Resampled timeframes are fed by their base stream, so one stream per symbol usually suffices.
+        streams = sorted({f"{symbol.lower()}@kline_{source_timeframe(timeframe)}" for symbol, timeframe in pairs})
+        async with aiohttp.ClientSession() as session:
+            tasks = [asyncio.create_task(self._consume_connection(session, chunk, pairs)) for chunk in chunked(streams, STREAMS_PER_CONNECTION)]
+            try:
+                done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+            finally:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _consume_connection(self, session, streams, pairs):
+        async with session.ws_connect(f"{BINANCE_STREAM_URL}?streams={'/'.join(streams)}", heartbeat=30) as ws:
+            STREAM_LOG.info("kline stream connected", extra=kv(streams=len(streams)))
+            next_check = time.monotonic() + STREAM_RESUBSCRIBE_INTERVAL
+            while True:
+                try:
+                    message = await ws.receive(timeout=STREAM_RESUBSCRIBE_INTERVAL)
+                except asyncio.TimeoutError:
+                    message = None
+                if message is not None:
+                    if message.type != aiohttp.WSMsgType.TEXT:
+                        return
+                    if KLINE_RECORD_FILE:
+                        with open(KLINE_RECORD_FILE, 'a') as record:
+                            record.write(message.data + '\n')
+                    self.handle_message(json.loads(message.data))
+                if time.monotonic() >= next_check:
+                    if await self.wanted_pairs() != pairs:
+                        return
+                    next_check = time.monotonic() + STREAM_RESUBSCRIBE_INTERVAL
+
+    async def replay(self, path):
+        with open(path) as feed:
+            for line in feed:
+                if line.strip():
+                    self.handle_message(json.loads(line))
+        if self._flush_task is not None:
+            await self._flush_task
+
+    def handle_message(self, payload):
+        kline = payload.get('data', payload).get('k')
+        if not kline:
+            return
+        self.messages += 1
+        symbol, timeframe = kline['s'], kline['i']
+        row = [kline['t'], float(kline['o']), float(kline['h']), float(kline['l']), float(kline['c']), float(kline['v'])]
+        CANDLE_STORE.apply(symbol, timeframe, [row])
+        if kline['x']:
+            self.closes += 1
+            self._pending.add((symbol, timeframe))
+            close_time = kline['t'] + TIMEFRAME_MS.get(timeframe, 0)
+            for derived in RESAMPLE_TIMEFRAMES:
+                if derived in TIMEFRAME_MS and source_timeframe(derived) == timeframe and close_time % TIMEFRAME_MS[derived] == 0:
+                    self._pending.add((symbol, derived))
+            if self._flush_task is None or self._flush_task.done():
+                self._flush_task = asyncio.create_task(self._flush())
+
+    async def _flush(self):
+        # Bars of every symbol close at the same instant; a short settle delay turns them into one batched scan.
+        await asyncio.sleep(STREAM_SETTLE_DELAY)
+        pairs, self._pending = self._pending, set()
+        try:
+            await run_signal_scan(only_pairs=pairs)
+        except Exception:
+            STREAM_LOG.exception("closed candle scan failed")
+
+KLINE_STREAM = KlineStream()
+
+# --- Sharded Scan Workers ---
+SCAN_SHARDS = int(os.getenv('SCAN_SHARDS', '0'))  # > 0: scanning moves to `--worker` processes
+WORKER_LEASE_SECONDS = float(os.getenv('WORKER_LEASE_SECONDS', '60'))
+OUTBOX_POLL_INTERVAL = float(os.getenv('OUTBOX_POLL_INTERVAL', '2'))
+OUTBOX_BATCH_SIZE = 500
+WORKER_MODE = False
+
+def shard_of(symbol, timeframe, shards=None):
+    return zlib.crc32(f"{symbol}:{timeframe}".encode()) % (shards or SCAN_SHARDS)
+
+class ShardLeases:
+    # Workers coordinate through SQLite: each heartbeats into scan_workers and holds time-limited leases on
+    # roughly shards / live workers shards. Leases of a dead worker expire and are picked up by the others;
+    # a worker holding more than its share releases the surplus so late joiners get work.
+    def __init__(self, worker_id, shards):
+        self.worker_id = worker_id
+        self.shards = shards
+        self.owned = set()
+
+    def _renew(self, conn):
+        now = time.time()
+        expires_at = now + WORKER_LEASE_SECONDS
+        conn.execute('INSERT OR REPLACE INTO scan_workers (worker_id, seen_at) VALUES (?, ?)', (self.worker_id, now))
+        conn.execute('DELETE FROM scan_workers WHERE seen_at < ?', (now - WORKER_LEASE_SECONDS,))
+        conn.executemany('INSERT OR IGNORE INTO scan_leases (shard) VALUES (?)', [(shard,) for shard in range(self.shards)])
+        live_workers = conn.execute('SELECT COUNT(*) FROM scan_workers').fetchone()[0]
+        fair_share = -(-self.shards // max(1, live_workers))
+
+        owned = [row[0] for row in conn.execute('SELECT shard FROM scan_leases WHERE owner = ? AND expires_at >= ? ORDER BY shard', (self.worker_id, now))]
+        surplus, owned = owned[fair_share:], owned[:fair_share]
+        conn.executemany('UPDATE scan_leases SET owner = NULL, expires_at = 0 WHERE shard = ?', [(shard,) for shard in surplus])
+        conn.executemany('UPDATE scan_leases SET expires_at = ? WHERE shard = ?', [(expires_at, shard) for shard in owned])
+
+        if len(owned) < fair_share:
+            free = conn.execute(
+                'SELECT shard FROM scan_leases WHERE shard < ? AND (owner IS NULL OR expires_at < ?) ORDER BY shard LIMIT ?',
+                (self.shards, now, fair_share - len(owned)),
+            ).fetchall()
+            for (shard,) in free:
+                claimed = conn.execute(
+                    'UPDATE scan_leases SET owner = ?, expires_at = ? WHERE shard = ? AND (owner IS NULL OR expires_at < ?)',
+                    (self.worker_id, expires_at, shard, now),
+                ).rowcount
+                if claimed:
+                    owned.append(shard)
+        return set(owned)
+
+    def _release(self, conn):
+        conn.execute('UPDATE scan_leases SET owner = NULL, expires_at = 0 WHERE owner = ?', (self.worker_id,))
+        conn.execute('DELETE FROM scan_workers WHERE worker_id = ?', (self.worker_id,))
+
+    async def renew(self):
+        owned = await DB.run(self._renew)
+        if owned != self.owned:
+            SCAN_LOG.info("shard leases changed", extra=kv(worker=self.worker_id, shards=','.join(map(str, sorted(owned))) or '-'))
+        self.owned = owned
+        return owned
+
+    async def release(self):
+        await DB.run(self._release)
+        self.owned = set()
+
+async def run_worker(worker_id=None):
+    global WORKER_MODE
+    WORKER_MODE = True
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    shards = SCAN_SHARDS or 1
+    leases = ShardLeases(worker_id, shards)
+    await init_exchange()
+    next_scan = {timeframe: time.time() + seconds_until_close(timeframe) + SCAN_SETTLE_DELAY for timeframe in TIMEFRAMES_ENUM}
+    SCAN_LOG.info("scan worker started", extra=kv(worker=worker_id, shards=shards))
+    try:
+        while True:
+            owned = await leases.renew()
+            due = {timeframe for timeframe, scan_at in next_scan.items() if scan_at <= time.time()}
+            if due:
+                await reload_subscriptions()
+                pairs = {pair for pair, user_ids in SUBSCRIPTIONS.items() if user_ids and shard_of(*pair, shards) in owned}
+                await run_signal_scan(only_pairs=pairs, timeframes=due)
+                for timeframe in due:
+                    next_scan[timeframe] = time.time() + seconds_until_close(timeframe) + SCAN_SETTLE_DELAY
+            await asyncio.sleep(max(0.0, min(WORKER_LEASE_SECONDS / 3, min(next_scan.values()) - time.time())))
+    finally:
+        await leases.release()
+        await close_exchange()
+        await DB.close()
+        EXECUTORS.shutdown()
+
+async def drain_scan_outbox(context: ContextTypes.DEFAULT_TYPE):
+    # Bot side of sharded scanning: deliver what the workers computed, resolving recipients here so
+    # subscription changes made since the worker's scan are respected.
+    rows = await DB.fetchall('SELECT id, payload FROM scan_outbox ORDER BY id LIMIT ?', (OUTBOX_BATCH_SIZE,))
+    if not rows:
+        return
+    subscribed_users = dict(await get_subscribed_users())
+    for _, payload in rows:
+        levels = json.loads(payload)
+        recipients = {user_id: subscribed_users[user_id] for user_id in SUBSCRIPTIONS.subscribers(levels['symbol'], levels['timeframe']) if user_id in subscribed_users}
+        BROADCASTER.broadcast(build_signal_messages(levels, recipients), name=f"{levels['symbol']} {levels['timeframe']} {levels['signal']}")
+    await DB.execute('DELETE FROM scan_outbox WHERE id <= ?', (rows[-1][0],))
+    METRICS.inc('outbox_signals_delivered', len(rows))
+
+# --- News Pipeline ---
+NEWS_RETENTION_DAYS = int(os.getenv('NEWS_RETENTION_DAYS', '30'))
+NEWS_MAX_ENTRIES_PER_FEED = int(os.getenv('NEWS_MAX_ENTRIES_PER_FEED', '5'))  # newest stories per feed sent on a cold start
+NEWS_ENTRIES_PER_MESSAGE = 5
+NEWS_FETCH_TIMEOUT = 30
+
+class NewsPipeline:
+    # Polls every feed concurrently with conditional requests and dedupes links against an in-memory set
+    # that is warm-started from sent_news and pruned by retention.
+    def __init__(self, feeds):
+        self.feeds = feeds
+        self.seen = {}
+        self._validators = {}
+        self._loaded = False
+        self._pruned_at = 0.0
+
+    async def load(self):
+        self.seen = {link: sent_at for link, sent_at in await get_sent_news()}
+        self._loaded = True
+
+    async def prune(self):
+        cutoff = datetime.datetime.now() - datetime.timedelta(days=NEWS_RETENTION_DAYS)
+        await prune_sent_news(cutoff)
+        cutoff_iso = cutoff.isoformat()
+        self.seen = {link: sent_at for link, sent_at in self.seen.items() if sent_at is None or sent_at >= cutoff_iso}
+        self._pruned_at = time.monotonic()
+
+    async def _read_local(self, url):
+        path = url[len('file://'):] if url.startswith('file://') else url
+        modified = os.path.getmtime(path)
+        if self._validators.get(url) == modified:
+            return None
+
+        def read():
+            with open(path, 'rb') as feed:
+                return feed.read()
+
+        body = await EXECUTORS.run('network', read)
+        self._validators[url] = modified
+        return body
+
+    async def _read_remote(self, session, url):
+        headers = {}
+        etag, last_modified = self._validators.get(url, (None, None))
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=NEWS_FETCH_TIMEOUT)) as response:
+            if response.status == 304:
+                return None
+            response.raise_for_status()
+            body = await response.read()
+            self._validators[url] = (response.headers.get('ETag'), response.headers.get('Last-Modified'))
+            return body
+
+    async def fetch_feed(self, session, url):
+        if url.startswith(('http://', 'https://')):
+            body = await self._read_remote(session, url)
+        else:
+            body = await self._read_local(url)
+        if body is None:
+            return []
+        feed = await EXECUTORS.run('compute', feedparser.parse, body)
+        return feed.entries
+
+    async def poll(self):
+        if not self._loaded:
+            await self.load()
+        if time.monotonic() - self._pruned_at > 24 * 60 * 60:
+            await self.prune()
+
+        async with aiohttp.ClientSession() as session:
+            results = await asyncio.gather(*(self.fetch_feed(session, url) for url in self.feeds), return_exceptions=True)
+
+        # With nothing seen yet, a feed's whole backlog would look new: send only its newest stories.
+        cold_start = not self.seen
+        new_entries = []
+        skipped = []
+        batch_links = set()
+        for url, entries in zip(self.feeds, results):
+            if isinstance(entries, Exception):
+                NEWS_LOG.warning("feed fetch failed", extra=kv(url=url, error=entries))
+                continue
+            fresh = []
+            for entry in entries:
+                link = entry.get('link')
+                if link and link not in self.seen and link not in batch_links:
+                    batch_links.add(link)
+                    fresh.append(entry)
+            # Feeds list newest first; on a cold start the older backlog is only marked as seen.
+            if cold_start:
+                skipped.extend(fresh[NEWS_MAX_ENTRIES_PER_FEED:])
+                fresh = fresh[:NEWS_MAX_ENTRIES_PER_FEED]
+            new_entries.extend(reversed(fresh))
+        if skipped:
+            await self.mark_sent(skipped)
+        return new_entries
+
+    async def mark_sent(self, entries):
+        links = [entry.get('link') for entry in entries]
+        await save_news_sent(links)
+        sent_at = datetime.datetime.now().isoformat()
+        for link in links:
+            self.seen[link] = sent_at
+
+def render_news_messages(entries, lang):
+    translations = get_messages(lang)
+    # Titles are escaped so a stray '_' or '*' cannot break the Markdown of the whole message.
+    blocks = [translations['news_alert'].format(title=escape_markdown(entry.get('title', '')), link=entry.get('link')) for entry in entries]
+    return ['\n\n'.join(chunk) for chunk in chunked(blocks, NEWS_ENTRIES_PER_MESSAGE)]
+
+NEWS_PIPELINE = NewsPipeline(NEWS_FEEDS)
 
 async def monitor_news(context: ContextTypes.DEFAULT_TYPE):
-    print("Running news monitor...")
-    update_bot_status('news')
+    await update_bot_status('news')
     try:
-        feed = feedparser.parse(NEWS_RSS_URL)
-        if feed.entries:
-            latest_news = feed.entries[0]
-            if not is_news_sent(latest_news.link):
-                subscribed_users = get_subscribed_users()
-                for user_id, lang, _, _ in subscribed_users:
-                    translations = get_messages(lang)
-                    message = translations['news_alert'].format(
-                        title=latest_news.title,
-                        link=latest_news.link
-                    )
-                    await context.bot.send_message(chat_id=user_id, text=message, parse_mode='Markdown')
-                save_news_sent(latest_news.link)
-    except Exception as e:
-        print(f"Error fetching news: {e}")
+        entries = await NEWS_PIPELINE.poll()
+        if entries:
+            subscribed_users = await get_subscribed_users()
+            rendered = {}
+            messages = []
+            for user_id, lang in subscribed_users:
+                if lang not in rendered:
+                    rendered[lang] = render_news_messages(entries, lang)
+                messages.extend((user_id, text, {'parse_mode': 'Markdown'}) for text in rendered[lang])
+            BROADCASTER.broadcast(messages, name=f"news ({len(entries)} stories)")
+            await NEWS_PIPELINE.mark_sent(entries)
+        NEWS_LOG.info("news poll finished", extra=kv(feeds=len(NEWS_PIPELINE.feeds), new_stories=len(entries)))
+    except Exception:
+        NEWS_LOG.exception("news poll failed")
+
+# --- Metrics Endpoint ---
+def collect_gauges():
+    scheduler = SCAN_SCHEDULER.stats()
+    user_cache = USER_CACHE.stats()
+    executors = {}
+    for name, stats in EXECUTORS.stats().items():
+        executors.update({
+            f'executor_{name}_queued': stats['queued'],
+            f'executor_{name}_avg_run_ms': stats['avg_run_ms'],
+            f'executor_{name}_max_run_ms': stats['max_run_ms'],
+            f'executor_{name}_avg_queue_wait_ms': stats['avg_queue_wait_ms'],
+        })
+    return {
+        'broadcast_queue_depth': BROADCASTER.pending(),
+        'blocked_chats': len(BROADCASTER.blocked_chats),
+        'ticker_cache_hit_ratio': TICKER_CACHE.stats()['hit_ratio'],
+        'user_cache_hit_ratio': user_cache['hit_ratio'],
+        'user_cache_avg_lookup_ms': user_cache['avg_lookup_ms'],
+        'analysis_cache_shared_ratio': ANALYSIS_CACHE.stats()['shared_ratio'],
+        'rejected_requests': USER_THROTTLE.rejected,
+        'scan_requests_saved': scheduler['requests_saved'],
+        'scan_requests_saved_ratio': scheduler['saved_ratio'],
+        **executors,
+    }
+
+async def metrics_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    if user_id != ADMIN_USER_ID:
+        translations = get_messages(await get_user_language(user_id))
+        await update.message.reply_text(translations['admin_only'])
+        return
+
+    status_data = await get_bot_status() or (None, None)
+    report = render_metrics_report(collect_gauges())
+    header = f"last signal scan: {status_data[0] or 'N/A'}\nlast news scan: {status_data[1] or 'N/A'}\n"
+    await update.message.reply_text(f"```\n{(header + report)[:4000]}\n```", parse_mode='Markdown')
+
+class MetricsServer:
+    # Optional Prometheus scrape target; started only when METRICS_PORT is set.
+    def __init__(self, port):
+        self.port = port
+        self._runner = None
+
+    async def handle(self, request):
+        return web.Response(text=render_prometheus(collect_gauges()), content_type='text/plain', charset='utf-8')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '0.0.0.0', self.port).start()
+        BOT_LOG.info("metrics endpoint listening", extra=kv(port=self.port, path="/metrics"))
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+METRICS_SERVER = MetricsServer(METRICS_PORT)
+
+# --- Webhook Server ---
+SERVING_MODE = os.getenv('SERVING_MODE', 'polling')  # 'polling' or 'webhook'
+WEBHOOK_URL = os.getenv('WEBHOOK_URL') or os.getenv('RENDER_EXTERNAL_URL')  # public base URL Telegram posts to
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET') or secrets.token_urlsafe(32)  # generated only when the bot registers the webhook itself
+WEBHOOK_MAX_PENDING = int(os.getenv('WEBHOOK_MAX_PENDING', '1000'))  # queued updates before asking Telegram to retry
+PORT = int(os.getenv('PORT', '8080'))
+BOT_API_URL = os.getenv('BOT_API_URL')  # self-hosted Bot API server, e.g. http://localhost:8081/bot
+STARTUP_PROFILE_BACKGROUND_WAIT = 2.0  # lets background startup work (exchange import) show up in the profile
+
+class WebhookServer:
+    # Embedded aiohttp server: Telegram posts updates to WEBHOOK_PATH, which are checked against the secret
+    # token and handed to the Application's update queue; /healthz and /metrics share the same port.
+    def __init__(self, application, port=None, path=None, secret=None):
+        self.application = application
+        self.port = port or PORT
+        self.path = path or WEBHOOK_PATH
+        self.secret = secret or WEBHOOK_SECRET
+        self.started_at = time.time()
+        self._runner = None
+
+    async def handle_update(self, request):
+        token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not hmac.compare_digest(token, self.secret):
+            METRICS.inc('webhook_requests', outcome='forbidden')
+            return web.Response(status=403)
+        if self.application.update_queue.qsize() >= WEBHOOK_MAX_PENDING:
+            METRICS.inc('webhook_requests', outcome='overloaded')
+            return web.Response(status=503)
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except (ValueError, TypeError, KeyError, AttributeError):
+            # Not JSON, or JSON that is not an Update (missing or malformed fields).
+            METRICS.inc('webhook_requests', outcome='invalid')
+            return web.Response(status=400)
+        await self.application.update_queue.put(update)
+        METRICS.inc('webhook_requests', outcome='accepted')
+        return web.Response()
+
+    async def handle_health(self, request):
+        return web.json_response({
+            'status': 'ok',
+            'uptime': round(time.time() - self.started_at),
+            'pending_updates': self.application.update_queue.qsize(),
+            'broadcast_queue': BROADCASTER.pending(),
+        })
+
+    async def handle_metrics(self, request):
+        return web.Response(text=render_prometheus(collect_gauges()), content_type='text/plain', charset='utf-8')
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get('/healthz', self.handle_health)
+        app.router.add_get('/metrics', self.handle_metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, '0.0.0.0', self.port).start()
+        BOT_LOG.info("webhook server listening", extra=kv(port=self.port, path=self.path))
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+async def serve_webhook(application):
+    # run_polling()/run_webhook() normally drive the lifecycle and the post_init/post_shutdown hooks.
+    await application.initialize()
+    await on_startup(application)
+    await application.start()
+    server = WebhookServer(application)
+    await server.start()
+    if WEBHOOK_URL:
+        url = WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH
+        await application.bot.set_webhook(url=url, secret_token=WEBHOOK_SECRET, allowed_updates=Update.ALL_TYPES)
+        BOT_LOG.info("webhook registered", extra=kv(url=url))
+    else:
+        BOT_LOG.info("WEBHOOK_URL is not set; expecting a webhook registered externally with WEBHOOK_SECRET as its secret token")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await server.stop()
+        await application.stop()
+        await on_shutdown(application)
+        await application.shutdown()
+
+BACKGROUND_TASKS = set()
+
+def run_in_background(coroutine):
+    task = asyncio.create_task(coroutine)
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+    return task
+
+async def on_startup(application: Application):
+    BROADCASTER.start(application.bot)
+    # Markets load in the background; polling starts without waiting for the exchange.
+    run_in_background(init_exchange())
+    if SCAN_MODE == 'streaming' and not SCAN_SHARDS:
+        KLINE_STREAM.start()
+    if METRICS_PORT:
+        await METRICS_SERVER.start()
+    application.job_queue.run_repeating(refresh_markets, interval=MARKETS_REFRESH_INTERVAL, first=MARKETS_REFRESH_INTERVAL)
+
+async def on_shutdown(application: Application):
+    for task in list(BACKGROUND_TASKS):
+        task.cancel()
+    await asyncio.gather(*BACKGROUND_TASKS, return_exceptions=True)
+    await KLINE_STREAM.stop()
+    await METRICS_SERVER.stop()
+    await BROADCASTER.stop()
+    await close_exchange()
+    await DB.close()
+    EXECUTORS.shutdown()
         
+async def profile_startup(application):
+    # Same lifecycle as run_polling() up to the first getUpdates, timed phase by phase, then shut down.
+    try:
+        with startup_phase('application.initialize (getMe)'):
+            await application.initialize()
+        with startup_phase('on_startup'):
+            await on_startup(application)
+        with startup_phase('application.start'):
+            await application.start()
+        with startup_phase('start_polling (first getUpdates)'):
+            await application.updater.start_polling()
+        STARTUP_TIMINGS['time to first poll'] = time.perf_counter() - IMPORT_STARTED
+        await asyncio.sleep(STARTUP_PROFILE_BACKGROUND_WAIT)
+    except Exception:
+        BOT_LOG.exception("startup profile stopped early")
+    finally:
+        if application.updater.running:
+            await application.updater.stop()
+        if application.running:
+            await application.stop()
+        await on_shutdown(application)
+        await application.shutdown()
+
+def print_startup_profile():
+    print("Startup profile (ms, from interpreter import of this module):")
+    for name, seconds in STARTUP_TIMINGS.items():
+        print(f"  {name:<40} {seconds * 1000:9.1f}")
+
 def main():
-    setup_database()
+    parser = argparse.ArgumentParser(description="Crypto signals Telegram bot.")
+    parser.add_argument('--worker', action='store_true', help="run as a scan worker for SCAN_SHARDS sharded scanning")
+    parser.add_argument('--worker-id', help="stable worker name (default: host:pid)")
+    parser.add_argument('--startup-profile', action='store_true', help="time import and startup phases up to the first poll, then exit")
+    args = parser.parse_args()
+
+    STARTUP_TIMINGS['module import'] = time.perf_counter() - IMPORT_STARTED
+    load_config()
+    with startup_phase('setup_logging'):
+        setup_logging()
+    with startup_phase('setup_database'):
+        setup_database()
+
+    if args.worker:
+        asyncio.run(run_worker(args.worker_id))
+        return
     
     if not TOKEN or not ADMIN_USER_ID:
-        print("Please set the TOKEN and ADMIN_USER_ID environment variables.")
+        BOT_LOG.error("TOKEN and ADMIN_USER_ID environment variables must be set")
         return
-    
-    try:
-        url = f"https://api.telegram.org/bot{TOKEN}/deleteWebhook"
-        response = requests.get(url)
-        response.raise_for_status()
-        print("Webhook deleted successfully.")
-    except requests.exceptions.RequestException as e:
-        print(f"Failed to delete webhook: {e}")
-        
-    app = Application.builder().token(TOKEN).build()
+    if SERVING_MODE == 'webhook' and not WEBHOOK_URL and not os.getenv('WEBHOOK_SECRET'):
+        BOT_LOG.error("webhook mode without WEBHOOK_URL needs WEBHOOK_SECRET, the secret token of the externally registered webhook")
+        return
+
+    with startup_phase('build_application'):
+        app = build_application()
+    if args.startup_profile:
+        asyncio.run(profile_startup(app))
+        print_startup_profile()
+        return
+    BOT_LOG.info("bot running", extra=kv(serving_mode=SERVING_MODE, scan_mode=SCAN_MODE, signal_engine=SIGNAL_ENGINE))
+    if SERVING_MODE == 'webhook':
+        asyncio.run(serve_webhook(app))
+    else:
+        # start_polling() removes any registered webhook before the first getUpdates.
+        app.run_polling()
+
+def build_application(serving_mode=None, base_url=None):
+    builder = Application.builder().token(TOKEN).concurrent_updates(CONCURRENT_UPDATES).post_init(on_startup).post_shutdown(on_shutdown)
+    if base_url or BOT_API_URL:
+        builder = builder.base_url(base_url or BOT_API_URL)
+    if (serving_mode or SERVING_MODE) == 'webhook':
+        builder = builder.updater(None)
+    app = builder.build()
     job_queue = app.job_queue
-    
-    job_queue.run_repeating(monitor_tradingview_signals, interval=300, first=datetime.time(0, 0))
+
+    if SCAN_SHARDS:
+        job_queue.run_repeating(drain_scan_outbox, interval=OUTBOX_POLL_INTERVAL, first=OUTBOX_POLL_INTERVAL)
+    elif SCAN_MODE != 'streaming':
+        SCAN_SCHEDULER.attach(job_queue)
     job_queue.run_repeating(monitor_news, interval=600, first=datetime.time(0, 0))
+    job_queue.run_daily(compact_database, time=datetime.time(3, 30))
 
-    app.add_handler(CommandHandler("start", start_command))
-    app.add_handler(CommandHandler("myid", myid_command))
-    app.add_handler(CommandHandler("menu", menu_command))
-    app.add_handler(CommandHandler("status", status_command))
-    app.add_handler(CommandHandler("info", info_command))
-    app.add_handler(CommandHandler("admin_activate", admin_activate))
-    app.add_handler(CommandHandler("analyze", analyze_command))
-    app.add_handler(CallbackQueryHandler(callback_handler))
-    
-    print("Bot is running and monitoring signals automatically...")
-    app.run_polling()
+    def limit(handler, **kwargs):
+        return USER_THROTTLE.limit(timed_handler(handler), **kwargs)
+
+    app.add_handler(CommandHandler("start", limit(start_command)))
+    app.add_handler(CommandHandler("myid", limit(myid_command)))
+    app.add_handler(CommandHandler("menu", limit(menu_command)))
+    app.add_handler(CommandHandler("status", limit(status_command)))
+    app.add_handler(CommandHandler("info", limit(info_command)))
+    app.add_handler(CommandHandler("admin_activate", timed_handler(admin_activate)))
+    app.add_handler(CommandHandler("metrics", timed_handler(metrics_command)))
+    app.add_handler(CommandHandler("analyze", limit(analyze_command, cooldown=ANALYZE_COOLDOWN_SECONDS)))
+    app.add_handler(CommandHandler("symbols", limit(symbols_command)))
+    app.add_handler(InlineQueryHandler(timed_handler(inline_query_handler)))
+    app.add_handler(CallbackQueryHandler(USER_THROTTLE.serialize(timed_handler(callback_handler))))
+    return app
 
 if __name__ == "__main__":
     main()